@@ -1,14 +1,14 @@
 import html
-import logging
-import traceback
+import time
 
 import libadalang as lal
 
 import settings
-from log import logger
+from log import logger, metrics
 from adaflowgraph.models import Node, DataNode, OperationNode, ExtControlFlowGraph, ControlNode, DataEdge, LinkType, \
     EntryNode, EmptyNode, ControlEdge, StatementNode
 from .ast_utils import get_node_key, get_node_short_name, get_node_full_name
+from utils.ada_node_table import snapshot, node_text, node_children
 
 
 class NodeVisitor(object):
@@ -57,7 +57,56 @@ class BuildingContext:
         return self.var_key_to_def_nodes.get(var_key)
 
 
+class NameResolver:
+    """
+    Per-method cache of p_first_corresponding_decl. Every name is resolved through libadalang at most once,
+    failed resolutions included; the time spent and the failures are counted per method, see record_metrics().
+    """
+
+    def __init__(self):
+        self._decls = {}
+        self.resolved = 0
+        self.failed = 0
+        self.time = 0.0
+
+    def decl(self, node: lal.Name):
+        """Return the first corresponding decl of node, None if there is none or it could not be resolved."""
+        try:
+            return self._decls[node]
+        except KeyError:
+            pass
+
+        start = time.perf_counter()
+        try:
+            decl = node.p_first_corresponding_decl
+        except Exception as e:
+            logger.debug('Could not determine %s first corresponding decl: %s', node, e)
+            decl = None
+            self.failed += 1
+        elapsed = time.perf_counter() - start
+
+        self.resolved += 1
+        self.time += elapsed
+
+        self._decls[node] = decl
+        return decl
+
+    def type_expr(self, node: lal.Name):
+        """Return the type expression of the first corresponding decl of node, if it has one."""
+        decl = self.decl(node)
+        return getattr(decl, 'f_type_expr', None) if decl else None
+
+    def record_metrics(self):
+        """Add the counts of the method to the run metrics, once per method rather than per name."""
+        metrics.inc('names_resolved', self.resolved)
+        metrics.inc('name_resolution_failures', self.failed)
+        metrics.observe('name_resolution', self.time)
+
+
 class GraphBuilder:
+    # the closures run off an explicit stack, this only guards against dependency cycles that never settle
+    CLOSURE_MAX_DEPTH = 100000
+
     def build_from_source(self, file_path, source_code, show_dependencies=False, build_closure=True):
         context = lal.AnalysisContext()
         unit = context.get_from_buffer(file_path, source_code)
@@ -75,6 +124,7 @@ class GraphBuilder:
 
     def build_from_tree(self, node, show_dependencies=False, build_closure=True):
         log_level = settings.get('logger_file_log_level', 'INFO')
+        snapshot(node)
 
         if log_level != 'DEBUG':
             ada_node_visitor = AdaNodeVisitor()
@@ -83,6 +133,11 @@ class GraphBuilder:
 
         graph = ada_node_visitor.visit(node)
 
+        names = ada_node_visitor.names
+        names.record_metrics()
+        logger.debug('Resolved %s names for %s, %s failed, %sms', names.resolved, node, names.failed,
+                     int(names.time * 1000))
+
         if not show_dependencies:
             self.resolve_dependencies(graph)
 
@@ -93,13 +148,10 @@ class GraphBuilder:
 
     @classmethod
     def _build_data_closure(cls, node, processed_nodes):
-        if node.get_definitions():
+        if node.has_definitions():
             return
 
-        for edge in node.in_edges.copy():
-            if not isinstance(edge, DataEdge):
-                continue
-
+        for edge in [e for e in node.in_edges if isinstance(e, DataEdge)]:
             in_nodes = edge.node_from.get_definitions()
             if not in_nodes:
                 in_nodes.add(edge.node_from)
@@ -110,7 +162,7 @@ class GraphBuilder:
 
             for in_node in in_nodes:
                 if in_node not in processed_nodes:
-                    cls._build_data_closure(in_node, processed_nodes)
+                    yield in_node
 
                 for in_node_edge in in_node.in_edges:
                     if isinstance(in_node_edge, DataEdge) and not isinstance(in_node_edge.node_from, DataNode):
@@ -136,7 +188,7 @@ class GraphBuilder:
 
         for in_control in node.get_incoming_nodes(label=LinkType.CONTROL):  # only controls have out control edges now
             if in_control not in processed_nodes:
-                cls._build_control_closure(in_control, processed_nodes)
+                yield in_control
 
             for e in in_control.in_edges:
                 in_control2 = e.node_from
@@ -152,19 +204,19 @@ class GraphBuilder:
         if not isinstance(node, StatementNode):
             return
 
-        logger.debug(f'In node {node}')
+        logger.debug('In node %s', node)
         node_controls = {control for (control, branch_kind) in node.control_branch_stack}
-        for e in node.in_edges.copy():
+        for e in list(node.in_edges):
             in_node = e.node_from
             if not isinstance(e, ControlEdge) or not isinstance(in_node, ControlNode):  # op nodes processed as in_node2
                 continue
 
             if in_node not in processed_nodes:
-                logger.debug(f'Node {in_node} was not visited, going into')
-                cls._build_control_data_closure(in_node, processed_nodes)
+                logger.debug('Node %s was not visited, going into', in_node)
+                yield in_node
 
             visited = set()
-            for e2 in in_node.in_edges.copy():
+            for e2 in list(in_node.in_edges):
                 in_node2 = e2.node_from
                 if not isinstance(in_node2, OperationNode) and not isinstance(in_node2, ControlNode):
                     continue
@@ -196,8 +248,8 @@ class GraphBuilder:
                     branch_kind = in_lowest_e.branch_kind
 
                 in_node2.create_control_edge(node, branch_kind, add_to_stack=False)
-                logger.debug(f'Created control edge from {in_node2} to {node} with kind = {branch_kind} '
-                             f'for node={node}, in_node={in_node}, in_node2={in_node2}')
+                logger.debug('Created control edge from %s to %s with kind = %s for node=%s, in_node=%s, in_node2=%s',
+                             in_node2, node, branch_kind, node, in_node, in_node2)
                 visited.add(in_node2)
 
         processed_nodes.add(node)
@@ -208,8 +260,25 @@ class GraphBuilder:
         processed_nodes = set()
         for node in fg.nodes:
             if node not in processed_nodes:
-                logger.debug(f'Running processor_fn for node {node}')
-                processor_fn(node, processed_nodes)
+                logger.debug('Running processor_fn for node %s', node)
+                cls._run_processor(processor_fn, node, processed_nodes)
+
+    @classmethod
+    def _run_processor(cls, processor_fn, node, processed_nodes):
+        # processors are generators yielding the nodes that have to be processed before they can go on.
+        # Resuming them from an explicit stack visits nodes in the same order as plain recursion would,
+        # without putting deep dependency chains on the Python call stack.
+        stack = [processor_fn(node, processed_nodes)]
+        while stack:
+            try:
+                dependency = next(stack[-1])
+            except StopIteration:
+                stack.pop()
+                continue
+
+            if len(stack) >= cls.CLOSURE_MAX_DEPTH:
+                raise RecursionError(f'Dependency chain of {node} is deeper than {cls.CLOSURE_MAX_DEPTH} nodes')
+            stack.append(processor_fn(dependency, processed_nodes))
 
     @classmethod
     def build_closure(cls, fg):
@@ -235,7 +304,7 @@ class GraphBuilder:
                 return
 
             if in_dep not in processed_nodes:
-                cls._adjust_controls(in_dep, processed_nodes)
+                yield in_dep
 
             control_branch_stacks.append(in_dep.control_branch_stack)
         control_branch_stacks.append(node.control_branch_stack)
@@ -288,37 +357,27 @@ class AdaNodeVisitorHelper:
 
     def get_type_expr_label(self, node: lal.SubtypeIndication):
         if node.f_constraint:
-            return f'{node.text}(*)'
+            return f'{node_text(node)}(*)'
         else:
-            return node.text
+            return node_text(node)
 
     def get_exas_label(self, node: lal.Name):
         if isinstance(node, lal.Identifier):
-            try:
-                if node.p_first_corresponding_decl:
-                    if node.p_first_corresponding_decl.f_type_expr:
-                        return self.get_type_expr_label(node.p_first_corresponding_decl.f_type_expr)
-                return node.text
-            except Exception as e:
-                print('an exception occurred:', e)
-                traceback.print_exc()
-                return node.text
+            type_expr = self.visitor.names.type_expr(node)
+            if type_expr:
+                return self.get_type_expr_label(type_expr)
+            return node_text(node)
         elif isinstance(node, lal.DottedName):
             prefix_label = self.get_exas_label(node.f_prefix)
-            suffix_label = node.f_suffix.text
+            suffix_label = node_text(node.f_suffix)
             return f'{prefix_label}.{suffix_label}'
         elif isinstance(node, lal.CallExpr):
-            try:
-                if isinstance(node.f_name, lal.AttributeRef):
-                    return node.f_name.text
-                if node.f_name.p_first_corresponding_decl:
-                    if node.f_name.p_first_corresponding_decl.f_type_expr:
-                        return self.get_type_expr_label(node.f_name.p_first_corresponding_decl.f_type_expr)
-                return node.f_name.text
-            except Exception as e:
-                print('an exception occurred:', e)
-                traceback.print_exc()
-                return node.f_name.text
+            if isinstance(node.f_name, lal.AttributeRef):
+                return node_text(node.f_name)
+            type_expr = self.visitor.names.type_expr(node.f_name)
+            if type_expr:
+                return self.get_type_expr_label(type_expr)
+            return node_text(node.f_name)
         elif isinstance(node, lal.ExplicitDeref):
             return f'{self.get_exas_label(node.f_prefix)}.all'
         else:
@@ -371,6 +430,7 @@ class AdaNodeVisitor(NodeVisitor):
     def __init__(self):
         self.context_stack = [BuildingContext()]
         self.fg = self.create_graph()
+        self.names = NameResolver()
 
         self.current_control = None
         self.current_branch_kind = True
@@ -496,7 +556,7 @@ class AdaNodeVisitor(NodeVisitor):
                                  op_kind=OperationNode.Kind.BINARY)
 
     def visit_BoxExpr(self, node: lal.BoxExpr):
-        return self.create_graph(node=DataNode(self._clear_literal_label(node.text), node, kind=DataNode.Kind.LITERAL))
+        return self.create_graph(node=DataNode(self._clear_literal_label(node_text(node)), node, kind=DataNode.Kind.LITERAL))
 
     def visit_BracketAggregate(self, node: lal.BracketAggregate):
         graph = self.create_graph()
@@ -599,16 +659,10 @@ class AdaNodeVisitor(NodeVisitor):
         suffix_name = get_node_full_name(node)
         suffix_key = get_node_key(node)
 
-        try:
-            if isinstance(node.p_first_corresponding_decl, lal.PackageDecl):
-                kind = DataNode.Kind.PACKAGE_USAGE
-            else:
-                kind = DataNode.Kind.VARIABLE_USAGE
-        except Exception as e:
-            print('an exception occurred:', e)
-            traceback.print_exc()
-            logger.warning(f'Could not determine {node} first corresponding decl')
-            kind = DataNode.Kind.VARIABLE_USAGE  # Or undefined?
+        if isinstance(self.names.decl(node), lal.PackageDecl):
+            kind = DataNode.Kind.PACKAGE_USAGE
+        else:
+            kind = DataNode.Kind.VARIABLE_USAGE
 
         data_node = DataNode(self.visitor_helper.get_exas_label(node), node, kind=kind, key=suffix_key)
         graph.add_node(data_node, link_type=LinkType.QUALIFIER, clear_sinks=True)
@@ -687,7 +741,7 @@ class AdaNodeVisitor(NodeVisitor):
         then_graph = self._visit_control_expr(control_node, node.f_then_expr, True)
 
         if len(node.f_alternatives):
-            else_graph = self._visit_alternatives_expr(control_node, node.f_alternatives.children, node.f_else_expr, False)
+            else_graph = self._visit_alternatives_expr(control_node, node_children(node.f_alternatives), node.f_else_expr, False)
         else:
             else_graph = self._visit_control_expr(control_node, node.f_else_expr, False)
 
@@ -709,7 +763,7 @@ class AdaNodeVisitor(NodeVisitor):
         dummy_node.set_property(Node.Property.DEF_BY, sink_nums)
         expr_graph.add_node(OperationNode(OperationNode.Label.ASSIGN, expr, self.control_branch_stack, kind=OperationNode.Kind.ASSIGN), link_type=LinkType.PARAMETER)
         expr_graph.add_node(dummy_node, link_type=LinkType.DEFINITION)
-        graph.merge_graph(expr_graph)
+        graph.merge_graph(expr_graph, keep_graph=True)
         self._pop_control_branch()
         return expr_graph
 
@@ -743,11 +797,11 @@ class AdaNodeVisitor(NodeVisitor):
         graph = self.visit(node.f_cond_expr)
         graph.add_node(control_node, link_type=LinkType.CONDITION)
 
-        then_graph = self._visit_control_node_body(control_node, node.f_then_stmts.children, True)
+        then_graph = self._visit_control_node_body(control_node, node_children(node.f_then_stmts), True)
         if len(node.f_alternatives):
             else_graph = self._visit_alternatives(control_node, list(node.f_alternatives), node.f_else_stmts, False)
         else:
-            else_graph = self._visit_control_node_body(control_node, node.f_else_stmts.children or [], False)
+            else_graph = self._visit_control_node_body(control_node, node_children(node.f_else_stmts) or [], False)
         graph.parallel_merge_graphs([then_graph, else_graph])
         return graph
 
@@ -773,7 +827,7 @@ class AdaNodeVisitor(NodeVisitor):
         return self.visit(node.f_stmt)
 
     def visit_NullLiteral(self, node: lal.NullLiteral):
-        return self.create_graph(node=DataNode(self._clear_literal_label(node.text), node, kind=DataNode.Kind.LITERAL))
+        return self.create_graph(node=DataNode(self._clear_literal_label(node_text(node)), node, kind=DataNode.Kind.LITERAL))
 
     def visit_NullStmt(self, node: lal.NullStmt):
         return self.create_graph(node=OperationNode(OperationNode.Label.NULL, node, self.control_branch_stack))
@@ -791,7 +845,7 @@ class AdaNodeVisitor(NodeVisitor):
         return graph
 
     def visit_OthersDesignator(self, node: lal.OthersDesignator):
-        return self.create_graph(node=DataNode(self._clear_literal_label(node.text), node, kind=DataNode.Kind.LITERAL))
+        return self.create_graph(node=DataNode(self._clear_literal_label(node_text(node)), node, kind=DataNode.Kind.LITERAL))
 
     def visit_PackageDecl(self, node: lal.PackageDecl):
         return self.create_graph()
@@ -822,7 +876,7 @@ class AdaNodeVisitor(NodeVisitor):
         return self.create_graph()
 
     def visit_QualExpr(self, node: lal.QualExpr):
-        return self._visit_op(node.f_prefix.text, node, OperationNode.Kind.QUALIFIEDEXPR, [node.f_suffix])
+        return self._visit_op(node_text(node.f_prefix), node, OperationNode.Kind.QUALIFIEDEXPR, [node.f_suffix])
 
     def visit_QuantifiedExpr(self, node: lal.QuantifiedExpr):
         self._switch_context(self.context.get_fork())
@@ -845,10 +899,10 @@ class AdaNodeVisitor(NodeVisitor):
         return graph
 
     def visit_QuantifierAll(self, node: lal.QuantifierAll):
-        return self.create_graph(node=DataNode(self._clear_literal_label(node.text), node, kind=DataNode.Kind.QUANTIFIER))
+        return self.create_graph(node=DataNode(self._clear_literal_label(node_text(node)), node, kind=DataNode.Kind.QUANTIFIER))
 
     def visit_QuantifierSome(self, node: lal.QuantifierSome):
-        return self.create_graph(node=DataNode(self._clear_literal_label(node.text), node, kind=DataNode.Kind.QUANTIFIER))
+        return self.create_graph(node=DataNode(self._clear_literal_label(node_text(node)), node, kind=DataNode.Kind.QUANTIFIER))
 
 
     def visit_RaiseStmt(self, node: lal.RaiseStmt):
@@ -869,7 +923,7 @@ class AdaNodeVisitor(NodeVisitor):
 
     def visit_StmtList(self, node: lal.StmtList):
         graph = self.create_graph()
-        for stmt in node.children:
+        for stmt in node_children(node):
             graph.merge_graph(self.visit(stmt))
         return graph
 
@@ -891,7 +945,7 @@ class AdaNodeVisitor(NodeVisitor):
             raise NotImplementedError(node.f_constraint)
         if isinstance(node.f_has_not_null, lal.NotNullPresent):
             raise NotImplementedError(node.f_has_not_null)
-        return self.create_graph(node=DataNode(self._clear_literal_label(node.text), node, kind=DataNode.Kind.SUBTYPE_INDICATION))
+        return self.create_graph(node=DataNode(self._clear_literal_label(node_text(node)), node, kind=DataNode.Kind.SUBTYPE_INDICATION))
 
     def visit_UnOp(self, node: lal.UnOp):
         op_name = node.f_op.__class__.__name__[2:]
@@ -935,7 +989,7 @@ class AdaNodeVisitor(NodeVisitor):
         if len(remaining_alternatives):
             else_graph = self._visit_alternatives(alt_control_node, remaining_alternatives, else_stmts, False)
         else:
-            else_graph = self._visit_control_node_body(alt_control_node, else_stmts.children or [], False)
+            else_graph = self._visit_control_node_body(alt_control_node, node_children(else_stmts) or [], False)
         conditional_graph.parallel_merge_graphs([then_graph, else_graph])
         graph.merge_graph(conditional_graph)
         self._pop_control_branch()
@@ -1036,24 +1090,13 @@ class AdaNodeVisitor(NodeVisitor):
         var_name = get_node_full_name(node)
         var_key = get_node_key(node)
         graph = self.create_graph()
-        try:
-            if isinstance(node.p_first_corresponding_decl, lal.PackageDecl):
-                kind = DataNode.Kind.PACKAGE_USAGE
-            else:
-                kind = DataNode.Kind.VARIABLE_USAGE
-        except Exception as e:
-            print('an exception occurred:', e)
-            traceback.print_exc()
-            logging.debug('Could not determine first corresponding decl')
+        if isinstance(self.names.decl(node), lal.PackageDecl):
+            kind = DataNode.Kind.PACKAGE_USAGE
+        else:
             kind = DataNode.Kind.VARIABLE_USAGE
-        try:
-            if node.p_first_corresponding_decl:
-                if node.p_first_corresponding_decl.f_type_expr:
-                    graph.add_node(DataNode(self.visitor_helper.get_type_expr_label(node.p_first_corresponding_decl.f_type_expr),
-                                            node, key=var_key, kind=kind))
-            graph.add_node(DataNode(node.text, node, key=var_key, kind=kind))
-        except Exception as e:
-            print('an exception occurred:', e)
-            traceback.print_exc()
-            graph.add_node(DataNode(node.text, node, key=var_key, kind=kind))
+
+        type_expr = self.names.type_expr(node)
+        if type_expr:
+            graph.add_node(DataNode(self.visitor_helper.get_type_expr_label(type_expr), node, key=var_key, kind=kind))
+        graph.add_node(DataNode(node_text(node), node, key=var_key, kind=kind))
         return graph
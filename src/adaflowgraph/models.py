@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import collections.abc
 from typing import Set
 
 from gumtree import GumTree
@@ -42,19 +43,18 @@ class Node:
 
         self.mapped = None
 
-        self.in_edges = set()  # todo: make protected some fields
-        self.out_edges = set()
+        self.in_edges = EdgeSet()  # todo: make protected some fields
+        self.out_edges = EdgeSet()
 
         self.version = version
 
         self._data = {}
 
+    def has_definitions(self):
+        return bool(self.in_edges.with_label(LinkType.REFERENCE))
+
     def get_definitions(self):
-        defs = set()
-        for e in self.in_edges:
-            if isinstance(e, DataEdge) and e.label == LinkType.REFERENCE:
-                defs.add(e.node_from)
-        return defs
+        return {e.node_from for e in self.in_edges.with_label(LinkType.REFERENCE)}
 
     def create_edge(self, node_to, link_type):
         e = DataEdge(link_type, node_from=self, node_to=node_to)
@@ -62,8 +62,8 @@ class Node:
         node_to.in_edges.add(e)
 
     def has_in_edge(self, node_from, label):
-        for e in self.in_edges:
-            if e.node_from == node_from and e.label == label:
+        for e in self.in_edges.with_label(label):
+            if e.node_from == node_from:
                 return True
         return False
 
@@ -76,18 +76,12 @@ class Node:
         e.node_to.in_edges.remove(e)
 
     def get_incoming_nodes(self, /, *, label=None):
-        result = set()
-        for e in self.in_edges:
-            if not label or e.label == label:
-                result.add(e.node_from)
-        return result
+        edges = self.in_edges.with_label(label) if label else self.in_edges
+        return {e.node_from for e in edges}
 
     def get_outgoing_nodes(self, /, *, label=None):
-        result = set()
-        for e in self.out_edges:
-            if not label or e.label == label:
-                result.add(e.node_to)
-        return result
+        edges = self.out_edges.with_label(label) if label else self.out_edges
+        return {e.node_to for e in edges}
 
     def __repr__(self):
         return f'#{self.statement_num}'
@@ -263,6 +257,122 @@ class DataEdge(Edge):
         super().__init__(label, node_from, node_to)
 
 
+class EdgeView(collections.abc.Set):
+    """Read-only view of the edges of an EdgeSet bucket, it follows the changes of the set."""
+    __slots__ = ('_edges',)
+
+    def __init__(self, edges):
+        self._edges = edges
+
+    def __contains__(self, e):
+        return e in self._edges
+
+    def __iter__(self):
+        return iter(self._edges)
+
+    def __len__(self):
+        return len(self._edges)
+
+
+class EdgeSet(set):
+    """
+    Set of edges that also keeps them bucketed by label code, so label queries read one bucket
+    instead of scanning every edge. The buckets are built on the first query, which keeps them out of
+    pickles and off nodes whose edges are never looked up by label.
+    """
+
+    def __init__(self, edges=()):
+        super().__init__(edges)
+        self._buckets = None
+
+    def __reduce__(self):
+        return self.__class__, (list(self),)
+
+    def _get_buckets(self):
+        if self._buckets is None:
+            self._buckets = {}
+            for e in self:
+                self._buckets.setdefault(LinkType.code(e.label), set()).add(e)
+        return self._buckets
+
+    def with_label(self, label):
+        """Edges with the given label. The view is live, copy it before adding or removing edges."""
+        buckets = self._get_buckets()
+        code = LinkType.code(label)
+        bucket = buckets.get(code)
+        if bucket is None:
+            bucket = buckets[code] = set()
+        return EdgeView(bucket)
+
+    def without_labels(self, labels):
+        excluded = {LinkType.code(label) for label in labels}
+        for code, edges in self._get_buckets().items():
+            if code not in excluded:
+                yield from edges
+
+    def add(self, e):
+        super().add(e)
+        if self._buckets is not None:
+            self._buckets.setdefault(LinkType.code(e.label), set()).add(e)
+
+    def remove(self, e):
+        super().remove(e)
+        if self._buckets is not None:
+            self._buckets[LinkType.code(e.label)].discard(e)
+
+    def discard(self, e):
+        super().discard(e)
+        if self._buckets is not None:
+            self._buckets.get(LinkType.code(e.label), set()).discard(e)
+
+    def pop(self):
+        e = super().pop()
+        if self._buckets is not None:
+            self._buckets[LinkType.code(e.label)].discard(e)
+        return e
+
+    def clear(self):
+        super().clear()
+        if self._buckets is not None:
+            for edges in self._buckets.values():
+                edges.clear()
+
+    def update(self, *others):
+        for edges in others:
+            for e in edges:
+                self.add(e)
+
+    def difference_update(self, *others):
+        for edges in others:
+            for e in list(edges):
+                self.discard(e)
+
+    def intersection_update(self, *others):
+        self.difference_update(set(self).difference(set(self).intersection(*others)))
+
+    def symmetric_difference_update(self, other):
+        other = set(other)
+        added = other.difference(self)
+        self.difference_update(other.intersection(self))
+        self.update(added)
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def __isub__(self, other):
+        self.difference_update(other)
+        return self
+
+    def __iand__(self, other):
+        self.intersection_update(other)
+        return self
+
+    def __ixor__(self, other):
+        self.symmetric_difference_update(other)
+        return self
+
+
 class LinkType:
     DEFINITION = 'def'
     RECEIVER = 'recv'
@@ -278,6 +388,17 @@ class LinkType:
     # hidden link types
     DEPENDENCE = 'dep'
 
+    ALL = [DEFINITION, RECEIVER, REFERENCE, PARAMETER, CONDITION, QUALIFIER, MAP, CONTROL, DEPENDENCE]
+    _CODES = {label: code for code, label in enumerate(ALL)}
+
+    @classmethod
+    def code(cls, label) -> int:
+        """Small integer code of a label, labels outside ALL get the next free one."""
+        code = cls._CODES.get(label)
+        if code is None:
+            code = cls._CODES[label] = len(cls._CODES)
+        return code
+
 
 class ExtControlFlowGraph:
     def __init__(self, visitor, /, *, node=None):
@@ -317,13 +438,25 @@ class ExtControlFlowGraph:
                 resolved_refs.add(ref_node)
         return resolved_refs
 
-    def merge_graph(self, graph, /, *, link_node=None, link_type=None):
+    @staticmethod
+    def _absorb(target: set, source: set, keep_source=False) -> set:
+        # merged sub-graphs are usually not used again, so their sets can be taken over:
+        # growing the larger set in place keeps building a method linear-ish instead of
+        # copying everything accumulated so far on each merge.
+        if len(source) > len(target) and not keep_source:
+            source |= target
+            return source
+        target |= source
+        return target
+
+    def merge_graph(self, graph, /, *, link_node=None, link_type=None, keep_graph=False):
+        """keep_graph must be set when the caller still uses the merged graph, its sets are taken over otherwise."""
         if link_node and link_type:
             for sink in self.sinks:
                 sink.create_edge(link_node, link_type)
 
-        self.nodes = self.nodes.union(graph.nodes)
-        self.op_nodes = self.op_nodes.union(graph.op_nodes)
+        self.nodes = self._absorb(self.nodes, graph.nodes, keep_source=keep_graph)
+        self.op_nodes = self._absorb(self.op_nodes, graph.op_nodes, keep_source=keep_graph)
 
         resolved_refs = self._resolve_refs(graph)
         unresolved_refs = graph.var_refs.difference(resolved_refs)
@@ -335,14 +468,14 @@ class ExtControlFlowGraph:
         self.sinks = graph.sinks
         self.statement_sinks = graph.statement_sinks
 
-        self.var_refs = self.var_refs.union(unresolved_refs)
+        self.var_refs |= unresolved_refs
 
     def parallel_merge_graphs(self, graphs, op_link_type=None):
-        old_sinks = self.sinks.copy()
-        old_statement_sinks = self.statement_sinks.copy()
+        old_sinks = self.sinks
+        old_statement_sinks = self.statement_sinks
 
-        self.sinks.clear()
-        self.statement_sinks.clear()
+        self.sinks = set()
+        self.statement_sinks = set()
 
         for graph in graphs:
             resolved_refs = self._resolve_refs(graph)
@@ -358,12 +491,12 @@ class ExtControlFlowGraph:
                 for source in graph.statement_sources:
                     sink.create_edge(source, link_type=LinkType.DEPENDENCE)
 
-            self.nodes = self.nodes.union(graph.nodes)
-            self.op_nodes = self.op_nodes.union(graph.op_nodes)
-            self.sinks = self.sinks.union(graph.sinks)
-            self.var_refs = self.var_refs.union(unresolved_refs)
+            self.nodes = self._absorb(self.nodes, graph.nodes)
+            self.op_nodes = self._absorb(self.op_nodes, graph.op_nodes)
+            self.sinks |= graph.sinks
+            self.var_refs |= unresolved_refs
 
-            self.statement_sinks = self.statement_sinks.union(graph.statement_sinks)
+            self.statement_sinks |= graph.statement_sinks
             # self.statement_sources = self.statement_sources.union(graph.statement_sources)
 
     def add_node(self, node: Node, /, *, link_type=None, clear_sinks=False):
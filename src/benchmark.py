@@ -0,0 +1,355 @@
+"""
+Benchmark of the mining pipeline over synthetic corpora, one stage at a time.
+
+The corpus is made of scaled-up copies of the examples (the subprograms are renamed, the changes stay the same)
+and of generated subprograms with many statements, some of them changed the way the examples are. Every stage
+is timed --repeat times and, unless --no-memory is set, run once more under tracemalloc for its peak memory,
+which only counts the allocations made by Python: the memory of libadalang units is not seen there, max_rss is
+given for the whole run instead. The report is a JSON file meant to be compared across commits.
+
+for example: python benchmark.py --scale 10 --statements 500 -o benchmark.json
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import libadalang as lal
+
+import adaflowgraph
+import changegraph
+from changegraph import storage
+from gumtree import GumTree
+from gumtree.matchers.composite_matchers import MATCHERS
+from log import logger, metrics
+from patterns import Miner
+from patterns.models import Pattern
+from treed.treed import TreedMapper
+from vcs.traverse import GitAnalyzer, RepoInfo
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+EXAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'examples')
+EXAMPLES = [('double_negation', 0), ('double_negation', 1), ('double_negation', 2), ('for_all', 0)]
+
+REPO_NAME = 'benchmark'
+REPO_URL = 'https://example.com/benchmark.git'
+
+
+class Stages:
+    PARSE = 'parse'
+    FLOW_GRAPH = 'flow_graph'
+    FLOW_GRAPH_NO_CLOSURE = 'flow_graph_no_closure'
+    GUMTREE = 'gumtree'  # one stage per matcher, gumtree[<matcher>]
+    TREED = 'treed'
+    CHANGE_GRAPH = 'change_graph'
+    STORE = 'store'
+    LOAD = 'load'
+    MINE = 'mine'
+    PRINT = 'print'
+
+
+class StageStats:
+    def __init__(self):
+        self.times = []
+        self.peak_memory = None
+        self.errors = 0
+
+    def to_json(self):
+        return {
+            'runs': len(self.times),
+            'errors': self.errors,
+            'total_time': sum(self.times),
+            'max_time': max(self.times, default=None),
+            'peak_memory': self.peak_memory
+        }
+
+
+class Benchmark:
+    def __init__(self, repeat=1, trace_memory=True):
+        self.repeat = repeat
+        self.trace_memory = trace_memory
+        self.stats = {}
+
+    def measure(self, stage, fn, *args):
+        """Run fn(*args) for the stage, the result is the one of the last timed run or None if it failed."""
+        stats = self.stats.setdefault(stage, StageStats())
+        try:
+            result = None
+            for _ in range(self.repeat):
+                start = time.perf_counter()
+                result = fn(*args)
+                stats.times.append(time.perf_counter() - start)
+
+            if self.trace_memory:
+                tracemalloc.start()
+                try:
+                    fn(*args)
+                    peak = tracemalloc.get_traced_memory()[1]
+                finally:
+                    tracemalloc.stop()
+                stats.peak_memory = max(stats.peak_memory or 0, peak)
+            return result
+        except Exception:
+            stats.errors += 1
+            logger.error(f'Benchmark stage {stage} failed', exc_info=True)
+            return None
+
+    def to_json(self):
+        return {stage: stats.to_json() for stage, stats in self.stats.items()}
+
+
+class CorpusGenerator:
+    """Pairs of files before and after changes, the same for the same seed."""
+
+    def __init__(self, out_dir, seed=0):
+        self.out_dir = out_dir
+        self.rng = random.Random(seed)
+        self.pairs = []
+
+    def generate(self, scale, subprograms, statements):
+        os.makedirs(self.out_dir, exist_ok=True)
+
+        for num in range(scale):
+            for example, i in EXAMPLES:
+                old_src, new_src = self._read_example(example, i)
+                name = re.search(r'(?:function|procedure)\s+(\w+)', old_src).group(1)
+                new_name = f'{name}_{num}'
+                self._add_pair(f'{example}_{i}_{num}',
+                               re.sub(rf'\b{name}\b', new_name, old_src),
+                               re.sub(rf'\b{name}\b', new_name, new_src))
+
+        for num in range(subprograms):
+            self._add_pair(f'generated_{num}', *self._generate_subprogram(f'Generated_{num}', statements))
+
+        return self.pairs
+
+    @staticmethod
+    def _read_example(example, i):
+        prefix = os.path.join(EXAMPLES_DIR, example, str(i))
+        with open(f'{prefix}_old.adb', 'r') as old_file, open(f'{prefix}_new.adb', 'r') as new_file:
+            return old_file.read(), new_file.read()
+
+    def _generate_subprogram(self, name, statements):
+        old_lines, new_lines = [], []
+        for i in range(statements):
+            old_statement, new_statement = self._generate_statement(i)
+            old_lines.extend(old_statement)
+            new_lines.extend(new_statement)
+
+        header = f'function {name} (V : Version; VS : Version_Set) return Boolean is\nbegin\n'
+        footer = f'    return True;\nend {name};\n'
+        return header + ''.join(old_lines) + footer, header + ''.join(new_lines) + footer
+
+    def _generate_statement(self, i):
+        kind = self.rng.randrange(4)
+        if kind == 0:
+            return [f'    X_{i} := not (not Y_{i});\n'], [f'    X_{i} := Y_{i};\n']
+        elif kind == 1:
+            old = [f'    for R of VS_{i} loop\n',
+                   '        if not Satisfies (V, R) then\n',
+                   '            return False;\n',
+                   '        end if;\n',
+                   '    end loop;\n']
+            new = [f'    if not (for all R of VS_{i} => Satisfies (V, R)) then\n',
+                   '        return False;\n',
+                   '    end if;\n']
+            return old, new
+        elif kind == 2:
+            statement = [f'    Count_{i} := Count_{i} + {self.rng.randrange(1, 100)};\n']
+            return statement, statement
+        else:
+            statement = [f'    if Count_{i} > Limit then\n',
+                         f'        Put_Line (Name_{i});\n',
+                         '    end if;\n']
+            return statement, statement
+
+    def _add_pair(self, name, old_src, new_src):
+        old_path = os.path.join(self.out_dir, f'{name}_old.adb')
+        new_path = os.path.join(self.out_dir, f'{name}_new.adb')
+        for path, src in [(old_path, old_src), (new_path, new_src)]:
+            with open(path, 'w') as f:
+                f.write(src)
+        self.pairs.append((old_path, new_path, old_src, new_src))
+
+
+def parse(path, src):
+    return lal.AnalysisContext().get_from_buffer(path, src)
+
+
+def build_flow_graph_without_closure(ast):
+    return adaflowgraph.build_from_tree(ast, build_closure=False)
+
+
+def map_by_treed(ast_m, ast_n, source_m, source_n):
+    mapper = TreedMapper(ast_m, ast_n, source_m, source_n)
+    mapper.map()
+    return mapper
+
+
+def store_graphs(graphs):
+    return [storage.store_graph(graph) for graph in graphs]
+
+
+def load_graphs(paths):
+    return [storage.load_graph(path) for path in paths]
+
+
+def mine(graphs):
+    miner = Miner()
+    miner.mine_patterns(graphs)
+    return miner
+
+
+def print_patterns(miner, size_to_patterns):
+    # printing empties the pattern sets of the miner, every run gets them back
+    miner._size_to_patterns = {size: set(patterns) for size, patterns in size_to_patterns.items()}
+    miner.print_patterns()
+
+
+def run_pair_stages(benchmark, pair_num, pair):
+    old_path, new_path, old_src, new_src = pair
+
+    benchmark.measure(Stages.PARSE, parse, old_path, old_src)
+    benchmark.measure(Stages.PARSE, parse, new_path, new_src)
+
+    old_method, = GitAnalyzer._extract_methods(old_path, old_src, REPO_NAME)
+    new_method, = GitAnalyzer._extract_methods(new_path, new_src, REPO_NAME)
+
+    for method in [old_method, new_method]:
+        benchmark.measure(Stages.FLOW_GRAPH, adaflowgraph.build_from_tree, method.ast)
+        benchmark.measure(Stages.FLOW_GRAPH_NO_CLOSURE, build_flow_graph_without_closure, method.ast)
+
+    for matcher in MATCHERS:
+        benchmark.measure(f'{Stages.GUMTREE}[{matcher}]', GumTree,
+                          old_method.ast, old_src, new_method.ast, new_src, matcher)
+
+    benchmark.measure(Stages.TREED, map_by_treed, old_method.ast, new_method.ast, old_src, new_src)
+
+    repo_info = RepoInfo(REPO_NAME, os.path.dirname(old_path), REPO_URL, f'{pair_num:040x}',
+                         datetime.datetime.now(datetime.timezone.utc), old_path, new_path, old_method, new_method)
+    graph = benchmark.measure(Stages.CHANGE_GRAPH, changegraph.build_from_trees,
+                              old_method.ast, new_method.ast, old_src, new_src, repo_info)
+    if graph is not None:
+        graph.build_adjacency()
+        old_method.store_src()
+        new_method.store_src()
+    return graph
+
+
+def run(args):
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='benchmark-')
+    storage.STORAGE_DIR = os.path.join(work_dir, 'change-graphs')
+    storage.BLOBS_DIR = os.path.join(storage.STORAGE_DIR, '.blobs')
+    Miner.OUTPUT_DIR = os.path.join(work_dir, 'patterns')
+    Miner.STORE_DIR = None
+    Miner.EXPORT_PATH = None
+    Miner.RENDER_GRAPHS = args.render
+
+    pairs = CorpusGenerator(os.path.join(work_dir, 'corpus'), seed=args.seed) \
+        .generate(args.scale, args.subprograms, args.statements)
+    logger.warning(f'Benchmark corpus of {len(pairs)} file pairs in {work_dir}')
+
+    benchmark = Benchmark(repeat=args.repeat, trace_memory=not args.no_memory)
+    start = time.perf_counter()
+
+    graphs = []
+    for pair_num, pair in enumerate(pairs):
+        graph = run_pair_stages(benchmark, pair_num, pair)
+        if graph is not None:
+            graphs.append(graph)
+
+    paths = benchmark.measure(Stages.STORE, store_graphs, graphs) or []
+    graphs = benchmark.measure(Stages.LOAD, load_graphs, paths) or []
+
+    miner = benchmark.measure(Stages.MINE, mine, graphs)
+    if miner is not None:
+        size_to_patterns = {size: set(patterns) for size, patterns in miner._size_to_patterns.items()}
+        benchmark.measure(Stages.PRINT, print_patterns, miner, size_to_patterns)
+
+    return {
+        'commit': get_commit_hash(),
+        'date': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'params': {
+            'scale': args.scale,
+            'subprograms': args.subprograms,
+            'statements': args.statements,
+            'seed': args.seed,
+            'repeat': args.repeat,
+            'trace_memory': not args.no_memory,
+            'render': args.render,
+            'async_mining': Pattern.DO_ASYNC_MINING,
+            'min_frequency': Pattern.MIN_FREQUENCY
+        },
+        'corpus': {
+            'pairs': len(pairs),
+            'lines': sum(old_src.count('\n') + new_src.count('\n') for _, _, old_src, new_src in pairs),
+            'change_graphs': len(graphs),
+            'change_graph_nodes': sum(len(graph.nodes) for graph in graphs),
+            'patterns': sum(len(patterns) for patterns in size_to_patterns.values()) if miner else None
+        },
+        'total_time': time.perf_counter() - start,
+        'max_rss': get_max_rss(),
+        'stages': benchmark.to_json(),
+        'metrics': metrics.get_summary()
+    }
+
+
+def get_commit_hash():
+    try:
+        result = subprocess.run(['git', 'rev-parse', 'HEAD'], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+    except OSError:
+        return None
+    return result.stdout.decode('utf-8').strip() or None
+
+
+def get_max_rss():
+    """Peak resident set size of the process in bytes, if the platform tells it."""
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-o', '--output', help='Path to the JSON report, - for stdout', type=str,
+                        default='benchmark.json')
+    parser.add_argument('--work-dir', help='Where the corpus, graphs and patterns go, a temporary dir by default',
+                        type=str)
+    parser.add_argument('--scale', help='Copies of every example', type=int, default=5)
+    parser.add_argument('--subprograms', help='Number of generated subprograms', type=int, default=3)
+    parser.add_argument('--statements', help='Statements per generated subprogram', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', help='Timed runs of every stage', type=int, default=1)
+    parser.add_argument('--no-memory', help='Skip the runs under tracemalloc', action='store_true')
+    parser.add_argument('--render', help='Render the pattern graphs with Graphviz', action='store_true')
+    args = parser.parse_args()
+
+    report = run(args)
+    if args.output == '-':
+        print(json.dumps(report, indent=2))
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        logger.warning(f'Benchmark report written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -8,3 +8,4 @@ build_from_trees = _builder.build_from_trees
 
 export_graph_image = visual.export_graph_image
 print_out_nodes = visual.print_out_nodes
+render_dot_files = visual.render_dot_files
@@ -0,0 +1,175 @@
+from array import array
+from multiprocessing import shared_memory
+from typing import Dict, List
+
+
+class GraphArena:
+    """
+    Change graphs packed into one shared memory block, so that pool workers read the graphs in place
+    instead of unpickling them with every task.
+
+    Nodes of all the graphs are numbered globally, graph g owning the numbers graph_offsets[g]:graph_offsets[g + 1]
+    in the order of its node indexes. Per node the block keeps codes of the label, the sub-kind and the version,
+    the number of the mapped node (-1 if none) and CSR lists of in/out edges with edge label codes.
+    The string tables behind the codes are small and travel with the block name as plain values.
+    """
+
+    ARRAYS = ['graph_offsets', 'labels', 'sub_kinds', 'versions', 'mapped',
+              'out_offsets', 'out_nodes', 'out_labels', 'in_offsets', 'in_nodes', 'in_labels']
+    ITEM_SIZE = array('i').itemsize
+
+    def __init__(self, shm, layout, tables):
+        self._shm = shm
+        self.layout = layout
+        self.tables = tables
+        self.graph_ids, self.label_table, self.sub_kind_table, self.edge_label_table = tables
+        self.graph_numbers: Dict[str, int] = {graph_id: number for number, graph_id in enumerate(self.graph_ids)}
+
+        for name, (offset, length) in layout.items():
+            setattr(self, name, shm.buf[offset:offset + length * self.ITEM_SIZE].cast('i'))
+
+        self._graphs: Dict[int, ArenaGraph] = {}
+
+    @classmethod
+    def create(cls, graphs):
+        """Pack the graphs in the given order into a new block, which the caller has to unlink."""
+        arrays = {name: array('i') for name in cls.ARRAYS}
+        graph_ids, label_table, sub_kind_table, edge_label_table = [], [], [], []
+        codes = [{}, {}, {}]
+
+        def code(table_num, table, value):
+            c = codes[table_num].get(value)
+            if c is None:
+                c = codes[table_num][value] = len(table)
+                table.append(value)
+            return c
+
+        bases = []
+        arrays['graph_offsets'].append(0)
+        for graph in graphs:
+            bases.append(arrays['graph_offsets'][-1])
+            graph_ids.append(graph.id)
+            arrays['graph_offsets'].append(bases[-1] + len(graph.node_list))
+
+        arrays['out_offsets'].append(0)
+        arrays['in_offsets'].append(0)
+        for graph, base in zip(graphs, bases):
+            for node in graph.node_list:
+                arrays['labels'].append(code(0, label_table, node.label))
+                arrays['sub_kinds'].append(code(1, sub_kind_table, node.sub_kind))
+                arrays['versions'].append(node.version)
+                arrays['mapped'].append(base + node.mapped.index if node.mapped else -1)
+
+                for e in node.out_edges:
+                    arrays['out_nodes'].append(base + e.node_to.index)
+                    arrays['out_labels'].append(code(2, edge_label_table, e.label))
+                arrays['out_offsets'].append(len(arrays['out_nodes']))
+
+                for e in node.in_edges:
+                    arrays['in_nodes'].append(base + e.node_from.index)
+                    arrays['in_labels'].append(code(2, edge_label_table, e.label))
+                arrays['in_offsets'].append(len(arrays['in_nodes']))
+
+        layout = {}
+        size = 0
+        for name in cls.ARRAYS:
+            layout[name] = (size, len(arrays[name]))
+            size += len(arrays[name]) * cls.ITEM_SIZE
+
+        shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        for name in cls.ARRAYS:
+            offset, length = layout[name]
+            shm.buf[offset:offset + length * cls.ITEM_SIZE] = arrays[name].tobytes()
+
+        return cls(shm, layout, (graph_ids, label_table, sub_kind_table, edge_label_table))
+
+    @classmethod
+    def attach(cls, name, layout, tables):
+        return cls(shared_memory.SharedMemory(name=name), layout, tables)
+
+    def get_attach_args(self):
+        """Everything attach() needs in another process."""
+        return self._shm.name, self.layout, self.tables
+
+    def get_graph(self, number) -> 'ArenaGraph':
+        """Node view of a packed graph, built on first use and kept until the arena is closed."""
+        graph = self._graphs.get(number)
+        if graph is None:
+            graph = self._graphs[number] = ArenaGraph(self, number)
+        return graph
+
+    def close(self):
+        self._graphs.clear()
+        for name in self.ARRAYS:
+            getattr(self, name).release()
+        self._shm.close()
+
+    def unlink(self):
+        self._shm.unlink()
+
+
+class ArenaGraph:
+    """
+    Read-only stand-in for a ChangeGraph unpacked from an arena.
+    Only carries what fragments look at while being extended and grouped: id, node_list and the node edges.
+    """
+
+    def __init__(self, arena: GraphArena, number):
+        self.number = number
+        self.id = arena.graph_ids[number]
+        self.path = None
+
+        base, end = arena.graph_offsets[number], arena.graph_offsets[number + 1]
+        self.node_list: List[ArenaNode] = [
+            ArenaNode(self, i - base, arena.label_table[arena.labels[i]],
+                      arena.sub_kind_table[arena.sub_kinds[i]], arena.versions[i])
+            for i in range(base, end)
+        ]
+
+        edge_labels = arena.edge_label_table
+        for i, node in zip(range(base, end), self.node_list):
+            mapped = arena.mapped[i]
+            node.mapped = self.node_list[mapped - base] if mapped >= 0 else None
+
+            for j in range(arena.out_offsets[i], arena.out_offsets[i + 1]):
+                node.out_edges.append(
+                    ArenaEdge(edge_labels[arena.out_labels[j]], node, self.node_list[arena.out_nodes[j] - base]))
+            for j in range(arena.in_offsets[i], arena.in_offsets[i + 1]):
+                node.in_edges.append(
+                    ArenaEdge(edge_labels[arena.in_labels[j]], self.node_list[arena.in_nodes[j] - base], node))
+
+
+class ArenaNode:
+    __slots__ = ('graph', 'index', 'label', 'sub_kind', 'version', 'mapped', 'in_edges', 'out_edges')
+
+    def __init__(self, graph, index, label, sub_kind, version):
+        self.graph = graph
+        self.index = index
+        self.label = label
+        self.sub_kind = sub_kind
+        self.version = version
+        self.mapped = None
+        self.in_edges = []
+        self.out_edges = []
+
+    @property
+    def key(self):
+        return self.graph.id, self.index
+
+    def __eq__(self, other):
+        return isinstance(other, ArenaNode) and self.key == other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __repr__(self):
+        return f'#{self.index} v{self.version} {self.label}'
+
+
+class ArenaEdge:
+    __slots__ = ('label', 'node_from', 'node_to')
+
+    def __init__(self, label, node_from, node_to):
+        self.label = label
+        self.node_from = node_from
+        self.node_to = node_to
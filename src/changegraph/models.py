@@ -1,11 +1,48 @@
-from adaflowgraph.models import DataNode, Node, OperationNode, ControlNode, LinkType
+import uuid
+from array import array
+
+from adaflowgraph.models import DataNode, Node, OperationNode, ControlNode, LinkType, EdgeSet
 import libadalang as lal
 
+from utils.ada_node_table import node_text
+
 
 class ChangeGraph:
     def __init__(self, repo_info=None):
+        self.id = uuid.uuid4().hex
         self.nodes = set()
+        self.node_list = []  # node.index -> node
+        self.adjacency = None
         self.repo_info = repo_info
+        self.path = None  # set once the graph is stored or loaded
+
+    def add_node(self, node):
+        assert node._hash is None, f'Node {node} was hashed before it got its key in the graph'
+        node.index = len(self.node_list)
+        node.key = (self.id, node.index)
+        node.set_graph(self)
+
+        self.node_list.append(node)
+        self.nodes.add(node)
+
+    def build_adjacency(self):
+        self.adjacency = Adjacency(self.node_list)
+
+    def ensure_indexed(self, legacy_id=None):
+        """
+        Give graphs stored before nodes had dense indexes an id, a node list and adjacency.
+        legacy_id becomes the graph id, so it has to be the same in every process loading the graph.
+        """
+        if self.node_list is None:
+            self.id = legacy_id
+            self.node_list = sorted(self.nodes, key=lambda n: n.id)
+            for index, node in enumerate(self.node_list):
+                node.index = index
+                node.key = (self.id, index)
+                node._hash = None
+            self.nodes = set(self.node_list)  # hashed again with the new keys
+        if self.adjacency is None:
+            self.build_adjacency()
 
     def __getstate__(self):
         return self.__dict__.copy()
@@ -13,6 +50,11 @@ class ChangeGraph:
     def __setstate__(self, state):
         self.__dict__.update(state)
 
+        if 'id' not in state:  # given by ensure_indexed()
+            self.id = None
+            self.node_list = None
+            self.adjacency = None
+
         # id_mapper = AdaNodeIdMapper()
 
         # context = lal.AnalysisContext()
@@ -30,6 +72,40 @@ class ChangeGraph:
         #     assert node.text == node.ast.text
 
 
+class Adjacency:
+    """
+    CSR adjacency of a change graph over dense node indexes: the out edges of the node with index i lead to
+    out_targets[out_offsets[i]:out_offsets[i + 1]] and carry the LinkType codes in out_labels at the same
+    positions; in edges are laid out the same way. Edges of a node are sorted by (index, label code).
+    """
+
+    def __init__(self, node_list):
+        self.out_offsets, self.out_targets, self.out_labels = self._build(
+            [[(e.node_to.index, LinkType.code(e.label)) for e in node.out_edges] for node in node_list])
+        self.in_offsets, self.in_targets, self.in_labels = self._build(
+            [[(e.node_from.index, LinkType.code(e.label)) for e in node.in_edges] for node in node_list])
+
+    @staticmethod
+    def _build(node_edges):
+        offsets = array('I', [0])
+        targets = array('I')
+        labels = array('B')
+        for edges in node_edges:
+            for target, label in sorted(edges):
+                targets.append(target)
+                labels.append(label)
+            offsets.append(len(targets))
+        return offsets, targets, labels
+
+    def out_edges(self, index):
+        start, end = self.out_offsets[index], self.out_offsets[index + 1]
+        return zip(self.out_targets[start:end], self.out_labels[start:end])
+
+    def in_edges(self, index):
+        start, end = self.in_offsets[index], self.in_offsets[index + 1]
+        return zip(self.in_targets[start:end], self.in_labels[start:end])
+
+
 class ChangeNode:  # todo: create base class for pfg and cg
     _NODE_ID = 0
 
@@ -72,15 +148,20 @@ class ChangeNode:  # todo: create base class for pfg and cg
         ChangeNode._NODE_ID += 1
         self.id = ChangeNode._NODE_ID
 
+        # (graph id, index in the graph) once added to a graph, stable across pickling and processes
+        self.index = None
+        self.key = (None, self.id)
+        self._hash = None  # hash of the key, computed once the key can no longer change
+
         self.statement_num = statement_num
         self.ast = ast
-        self.text = ast.text
+        self.text = node_text(ast)
 
         self.label = label
         self.original_label = original_label
 
-        self.in_edges = set()
-        self.out_edges = set()
+        self.in_edges = EdgeSet()
+        self.out_edges = EdgeSet()
         self.mapped = None
         self.graph = None
 
@@ -95,10 +176,22 @@ class ChangeNode:  # todo: create base class for pfg and cg
         state = self.__dict__.copy()
         if 'ast' in state:
             del state['ast']
+        del state['_hash']  # str hashes differ between processes
         return state
 
     def __setstate__(self, state):
         self.__dict__.update(state)
+        self._hash = None
+
+        if 'key' not in state:  # stored before nodes were keyed by graph
+            self.index = None
+            self.key = (None, self.id)
+
+        # graphs stored before edges were indexed keep plain sets
+        if not isinstance(self.in_edges, EdgeSet):
+            self.in_edges = EdgeSet(self.in_edges)
+        if not isinstance(self.out_edges, EdgeSet):
+            self.out_edges = EdgeSet(self.out_edges)
 
     @staticmethod
     def create_binop_label(node: lal.BinOp):
@@ -164,35 +257,29 @@ class ChangeNode:  # todo: create base class for pfg and cg
         if all([labels, excluded_labels]):
             raise ValueError('Unsupported combination of arguments')
 
-        result = set()
         edges = self.out_edges if need_out else self.in_edges
+        if labels:
+            edges = [e for label in set(labels) for e in edges.with_label(label)]
+        elif excluded_labels:
+            edges = edges.without_labels(excluded_labels)
 
-        for e in edges:
-            if excluded_labels and e.label in excluded_labels or labels and e.label not in labels:
-                continue
-
-            if need_out:
-                result.add(e.node_to)
-            else:
-                result.add(e.node_from)
-
-        return result
+        if need_out:
+            return {e.node_to for e in edges}
+        return {e.node_from for e in edges}
 
     def get_definitions(self):
-        defs = set()
-        for e in self.in_edges:
-            if isinstance(e, ChangeEdge) and e.label == LinkType.REFERENCE:
-                defs.add(e.node_from)
-        return defs
+        return {e.node_from for e in self.in_edges.with_label(LinkType.REFERENCE)}
 
     def set_graph(self, graph):
         self.graph = graph
 
     def __eq__(self, other):
-        return self.id == other.id
+        return self.key == other.key
 
     def __hash__(self):
-        return self.id
+        if self._hash is None:
+            self._hash = hash(self.key)
+        return self._hash
 
     def __repr__(self):
         return f'#{self.id} v{self.version} {self.label} ({self.original_label}) {self.kind}.{self.sub_kind}'
@@ -0,0 +1,67 @@
+import os
+import pickle
+import hashlib
+
+import settings
+from log import logger
+
+
+STORAGE_DIR = settings.get('change_graphs_storage_dir')
+BLOBS_DIR = os.path.join(STORAGE_DIR, '.blobs')
+
+
+def graph_path(repo_name, graph_id):
+    return os.path.join(STORAGE_DIR, repo_name, f'{graph_id}.pickle')
+
+
+def store_graph(graph):
+    path = graph_path(graph.repo_info.repo_name, graph.id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w+b') as f:
+        pickle.dump(graph, f, protocol=5)
+    graph.path = path
+    return path
+
+
+def load_graph(path):
+    with open(path, 'rb') as f:
+        graph = pickle.load(f)
+    graph.ensure_indexed(legacy_id=content_hash(os.path.relpath(path, STORAGE_DIR)))
+    graph.path = path
+    return graph
+
+
+def content_hash(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def _blob_path(blob_hash):
+    return os.path.join(BLOBS_DIR, blob_hash[:2], blob_hash)
+
+
+def store_blob(text):
+    """Store a text once per content, graphs refer to it by the returned hash."""
+    blob_hash = content_hash(text)
+    path = _blob_path(blob_hash)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    return blob_hash
+
+
+def load_blob(blob_hash):
+    with open(_blob_path(blob_hash), 'r', encoding='utf-8', newline='') as f:
+        return f.read()
+
+
+def iter_graph_paths():
+    dir_names = [dir_name for dir_name in os.listdir(STORAGE_DIR) if not dir_name.startswith('.')]
+    for dir_num, dir_name in enumerate(dir_names):
+        dir_path = os.path.join(STORAGE_DIR, dir_name)
+        file_names = os.listdir(dir_path)
+        logger.warning(f'Loading project [{1 + dir_num}/{len(dir_names)}].')
+        for file_name in file_names:
+            yield os.path.join(dir_path, file_name)
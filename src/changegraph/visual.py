@@ -1,5 +1,6 @@
 import graphviz as gv
 import os
+import subprocess
 
 from changegraph.models import Node, ChangeGraph, ChangeNode
 
@@ -64,13 +65,32 @@ def _convert_to_visual_graph(graph: ChangeGraph, file_name: str, separate_mapped
     return _get_nodes_digraph(graph.nodes, file_name, separate_mapped=separate_mapped)
 
 
-def export_graph_image(graph: ChangeGraph, path: str = 'change-graph.dot'):
+def export_graph_image(graph: ChangeGraph, path: str = 'change-graph.dot', render=True):
     directory, file_name = os.path.split(path)
     visual_graph = _convert_to_visual_graph(graph, file_name)
-    visual_graph.render(filename=file_name, directory=directory)
+    if render:
+        visual_graph.render(filename=file_name, directory=directory)
+    else:
+        visual_graph.save(filename=file_name, directory=directory)
 
 
-def print_out_nodes(nodes, path: str = 'nodes.dot'):
+def print_out_nodes(nodes, path: str = 'nodes.dot', render=True):
     directory, file_name = os.path.split(path)
     visual_graph = _get_nodes_digraph(nodes, file_name)
-    visual_graph.render(filename=path, directory=directory)
+    if render:
+        visual_graph.render(filename=path, directory=directory)
+    else:
+        visual_graph.save(filename=file_name, directory=directory)
+
+
+RENDER_BATCH_SIZE = 200
+
+
+def render_dot_files(paths, format='pdf'):
+    """
+    Render saved .dot files with one Graphviz run per batch instead of one per file.
+    Outputs are named the way render() names them, e.g. graph.dot.pdf.
+    """
+    paths = list(paths)
+    for i in range(0, len(paths), RENDER_BATCH_SIZE):
+        subprocess.run(['dot', f'-T{format}', '-O', *paths[i:i + RENDER_BATCH_SIZE]], check=True)
@@ -6,6 +6,8 @@ from gumtree.matchers.matchers import Matchers
 
 
 class Diff:
+    DEFAULT_MATCHER = 'gumtree-simple'
+
     def __init__(self, src, dst, mappings, edit_script):
         self.src = src
         self.dst = dst
@@ -13,18 +15,19 @@ class Diff:
         self.edit_script = edit_script
 
     @staticmethod
-    def compute(src_root, src_source, dst_root, dst_source, tree_generator=None, matcher=None, properties=None):
+    def compute(src_root, src_source, dst_root, dst_source, tree_generator=None, matcher=None, properties=None,
+                visitors=()):
         if not properties:
             properties = GumtreeProperties()
 
-        src = tree_generator.generate(src_root, src_source)
-        dst = tree_generator.generate(dst_root, dst_source)
+        src = tree_generator.generate(src_root, src_source, visitors=visitors)
+        dst = tree_generator.generate(dst_root, dst_source, visitors=visitors)
 
         return Diff._compute(src, dst, matcher, properties)
 
     @staticmethod
     def _compute(src, dst, matcher, properties):
-        m = MATCHERS['gumtree-simple']
+        m = MATCHERS[matcher or Diff.DEFAULT_MATCHER]
         # m.configure(properties)
         mappings = m.match(src.get_root(), dst.get_root())
         edit_script = SimplifiedChawatheScriptGenerator().compute_actions(mappings)
@@ -1,10 +1,11 @@
 from gumtree.gen.ada_tree_visitor import AdaTreeVisitor
 from gumtree.tree.tree_context import TreeContext
-from utils.ada_node_visitor import accept
+from utils.ada_node_visitor import accept_all
 
 
 class AdaTreeGenerator:
-    def generate(self, root, source) -> TreeContext:
+    def generate(self, root, source, visitors=()) -> TreeContext:
+        """Build the GumTree tree of root, the other visitors are run over root in the same walk."""
         visitor = AdaTreeVisitor(root, source)
-        accept(root, visitor)
+        accept_all(root, [visitor, *visitors])
         return visitor.get_tree_context()
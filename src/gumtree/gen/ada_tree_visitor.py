@@ -1,9 +1,12 @@
+from itertools import accumulate
+
 from libadalang import AdaNode, CompilationUnit, Identifier, StringLiteral, IntLiteral, RealLiteral, SubpBody
 from overrides import overrides
 
 from gumtree.tree.tree import Tree
 from gumtree.tree.tree_context import TreeContext
 from gumtree.tree.type import TypeSet
+from utils.ada_node_table import snapshot
 from utils.ada_node_visitor import AdaNodeVisitor
 
 
@@ -12,6 +15,9 @@ class AdaTreeVisitor(AdaNodeVisitor):
         self.trees = {}
         self.context = TreeContext()
         self.context.set_source(source)
+        self.table = snapshot(root)
+        # +1 for newline characters
+        self.line_offsets = [0] + list(accumulate(len(line) + 1 for line in source.splitlines()))
         tree = self.build_tree(root)
         self.context.set_root(tree)
         self.context.set_trees(self.trees)
@@ -27,35 +33,28 @@ class AdaTreeVisitor(AdaNodeVisitor):
             return True
         else:
             tree = self.build_tree(node)
-            parent = self.trees[node.parent]
+            parent = self.trees[self.table.parent(node)]
             parent.add_child(tree)
 
             if isinstance(node, Identifier):
-                tree.set_label(node.text)
+                tree.set_label(self.table.text(node))
             elif isinstance(node, StringLiteral):
                 tree.set_label(node.p_denoted_value)
             elif isinstance(node, IntLiteral):
-                tree.set_label(node.text)
+                tree.set_label(self.table.text(node))
             elif isinstance(node, RealLiteral):
-                tree.set_label(node.text)
+                tree.set_label(self.table.text(node))
 
         return True
 
     def get_absolute_position(self, node: AdaNode):
-        # Split the source code into lines
-        lines = self.context.get_source().splitlines()
-
-        # Calculate the position up to the start line
-        absolute_position = sum(len(line) + 1 for line in lines[:node.sloc_range.start.line - 1])  # +1 for newline characters
-
-        # Add the column offset to the position
-        absolute_position += node.sloc_range.start.column - 1
-        return absolute_position
+        line, column = self.table.start(node)
+        return self.line_offsets[min(line - 1, len(self.line_offsets) - 1)] + column - 1
 
     def build_tree(self, node: AdaNode) -> Tree:
         tree = self.context.create_tree(TypeSet.type(type(node).__name__), Tree.NO_LABEL)
         tree.ast = node
         tree.set_pos(self.get_absolute_position(node))
-        tree.set_length(len(node.text))
+        tree.set_length(len(self.table.text(node)))
         self.trees[node] = tree
         return tree
@@ -2,6 +2,7 @@ from enum import Enum
 
 from libadalang import BinOp
 
+from log import metrics
 from gumtree.actions.diff import Diff
 from gumtree.gen.ada_tree_generator import AdaTreeGenerator
 
@@ -15,11 +16,14 @@ class GumTree:
         MOVED = 4
         UPDATED = 5
 
-    def __init__(self, src_root, src_source, dst_root, dst_source):
-        self.diff = Diff.compute(src_root, src_source, dst_root, dst_source, AdaTreeGenerator())
-        self.classifier = self.diff.create_all_node_classifier()
-        self.changed_nodes = set()
-        self._apply_actions()
+    def __init__(self, src_root, src_source, dst_root, dst_source, matcher=None, visitors=()):
+        """visitors are run over the source root and then the destination one along with the tree generation."""
+        with metrics.timer('gumtree', matcher=matcher or Diff.DEFAULT_MATCHER):
+            self.diff = Diff.compute(src_root, src_source, dst_root, dst_source, AdaTreeGenerator(), matcher=matcher,
+                                     visitors=visitors)
+            self.classifier = self.diff.create_all_node_classifier()
+            self.changed_nodes = set()
+            self._apply_actions()
 
     @property
     def mappings(self):
@@ -1,3 +1,10 @@
 import log.logger as lgr
+import log.metrics as mtr
 
 logger = lgr.CustomLogger()
+metrics = mtr.Metrics(logger)
+
+
+def attach_log_queue(queue):
+    """Pool initializer sending the records of the worker to logger.get_queue() of the parent process."""
+    logger.attach_queue(queue)
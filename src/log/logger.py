@@ -1,4 +1,7 @@
+import atexit
 import logging
+import logging.handlers
+import multiprocessing
 import time
 import os
 import functools
@@ -7,6 +10,11 @@ import settings as settings
 
 
 class CustomLogger:
+    """
+    Messages are only built for enabled levels: log(level, 'Node %s', node) formats the text with the args and
+    log(level, lambda: ...) calls the function, both of them only after the level check, unlike f-strings.
+    """
+
     WARNING = logging.WARNING
     ERROR = logging.ERROR
     INFO = logging.INFO
@@ -15,11 +23,18 @@ class CustomLogger:
     FILE_PATH = settings.get('logger_file_path', 'app.log')
     FILE_LOG_LEVEL = getattr(logging, settings.get('logger_file_log_level', 'INFO').upper())
     STDOUT_LOG_LEVEL = getattr(logging, settings.get('logger_stdout_log_level', 'WARNING').upper())
+    PROGRESS_INTERVAL = settings.get('logger_progress_interval', 10)
 
     def __init__(self):
         self._logger = None
+        self._handlers = []
         self._setup()
 
+        self._queue = None
+        self._listener = None
+        self._name_to_progress = {}  # time and count of the last report
+        self._name_to_count = {}
+
         self.error = functools.partial(self.log, self.ERROR)
         self.warning = functools.partial(self.log, self.WARNING)
         self.info = functools.partial(self.log, self.INFO)
@@ -31,7 +46,8 @@ class CustomLogger:
 
         formatter = logging.Formatter('[%(asctime)s] %(levelname)s: %(message)s', datefmt='%d.%m.%Y %H:%M:%S')
 
-        fh = logging.FileHandler(self.FILE_PATH)
+        # the file is opened on the first record, pool workers attached to a queue never open it
+        fh = logging.FileHandler(self.FILE_PATH, delay=True)
         fh.setFormatter(formatter)
         fh.setLevel(self.FILE_LOG_LEVEL)
         self._logger.addHandler(fh)
@@ -42,10 +58,78 @@ class CustomLogger:
         self._logger.addHandler(sh)
         self._logger.setLevel(min(self.FILE_LOG_LEVEL, self.STDOUT_LOG_LEVEL))
 
-    def log(self, level, text, exc_info=False, start_time=None, show_pid=False):
+        self._handlers = [fh, sh]
+
+    def is_enabled_for(self, level):
+        return self._logger.isEnabledFor(level)
+
+    def log(self, level, text, *args, exc_info=False, start_time=None, show_pid=False):
+        if not self._logger.isEnabledFor(level):
+            return
+
+        if callable(text):
+            text = text()
+        if args:
+            text = text % args
         if start_time:
             text = f'{text} {int((time.time() - start_time) * 1000)}ms'
         if show_pid:
             text = f'pid{os.getpid()}: {text}'
 
         self._logger.log(level, f'{text} ', exc_info=exc_info)
+
+    def progress(self, name, count, total=None, level=WARNING, show_pid=False):
+        """
+        Log that count items of name are done, at most once every PROGRESS_INTERVAL seconds
+        apart from the first one and the last one if total is given, with the rate since the previous report.
+        When total is unknown, progress_done() logs the last count.
+        """
+        now = time.time()
+        self._name_to_count[name] = count
+        last = self._name_to_progress.get(name)
+        if last is not None and now - last[0] < self.PROGRESS_INTERVAL and count != total:
+            return
+
+        self._name_to_progress[name] = now, count
+        if not self._logger.isEnabledFor(level):
+            return
+
+        text = f'{name}: {count}' if total is None else f'{name}: {count}/{total}'
+        if last is not None and now > last[0]:
+            text = f'{text} ({(count - last[1]) / (now - last[0]):.1f}/s)'
+        self.log(level, text, show_pid=show_pid)
+
+    def progress_done(self, name, level=WARNING, show_pid=False):
+        """Log the last count passed to progress() for name, reported already or not, and start name over."""
+        self._name_to_progress.pop(name, None)
+        count = self._name_to_count.pop(name, None)
+        if count is not None:
+            self.log(level, '%s: %s done', name, count, show_pid=show_pid)
+
+    def get_queue(self):
+        """
+        Queue of a listener writing the records of pool workers with the handlers of this process,
+        the workers are attached to it with attach_queue() in the pool initializer.
+        """
+        if self._queue is None:
+            self._queue = multiprocessing.Queue(-1)
+            self._listener = logging.handlers.QueueListener(self._queue, *self._handlers,
+                                                            respect_handler_level=True)
+            self._listener.start()
+            atexit.register(self._stop_listener)
+        return self._queue
+
+    def attach_queue(self, queue):
+        """Send the records of this pool worker to the listener of the process which made the queue."""
+        for handler in self._handlers:
+            self._logger.removeHandler(handler)
+            handler.close()
+
+        self._handlers = [logging.handlers.QueueHandler(queue)]
+        self._logger.addHandler(self._handlers[0])
+        self._queue = queue
+
+    def _stop_listener(self):
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
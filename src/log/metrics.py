@@ -0,0 +1,271 @@
+import atexit
+import contextlib
+import json
+import math
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+
+import settings as settings
+
+
+class Histogram:
+    """
+    Values counted in log-scale buckets, so that histograms of different processes merge exactly
+    and percentiles are off by less than GROWTH times.
+    """
+
+    GROWTH = 1.05
+    ZERO_BUCKET = -2 ** 31  # values <= 0
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+        self.buckets = {}
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+        bucket = math.floor(math.log(value, self.GROWTH)) if value > 0 else self.ZERO_BUCKET
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def merge(self, other):
+        self.count += other.count
+        self.sum += other.sum
+        for value in [other.min, other.max]:
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
+
+        for bucket, count in other.buckets.items():
+            self.buckets[bucket] = self.buckets.get(bucket, 0) + count
+
+    def percentile(self, q):
+        if not self.count:
+            return None
+
+        rank = q * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                upper = 0 if bucket == self.ZERO_BUCKET else self.GROWTH ** (bucket + 1)
+                return min(max(upper, self.min), self.max)
+        return self.max
+
+    def to_json(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'min': self.min,
+            'max': self.max,
+            'p50': self.percentile(0.5),
+            'p95': self.percentile(0.95)
+        }
+
+
+class Metrics:
+    """
+    Counters and histograms keyed by a name and labels, e.g. metrics.inc('change_graphs', repo=repo_name),
+    timers are histograms of seconds.
+
+    The process importing this module first is the root one. Pool workers, forked or spawned, find the spool dir of
+    the root in the environment and flush() their metrics there as one file per process, the root merges the files
+    with its own metrics for the summaries, which are logged every SUMMARY_INTERVAL seconds once
+    start_summaries() is called and also dumped as JSON to DUMP_PATH if it is set.
+    """
+
+    SUMMARY_INTERVAL = settings.get('metrics_summary_interval', 60)
+    DUMP_PATH = settings.get('metrics_dump_path', required=False)
+    SPOOL_DIR_ENV = 'CPATMINER_METRICS_DIR'
+
+    def __init__(self, logger):
+        self._logger = logger
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._dirty = False
+        self._spool_name = uuid.uuid4().hex  # pids are recycled by pools restarting their workers
+
+        self._start_time = time.time()
+        self._summary_thread = None
+        self._summaries_stopped = threading.Event()
+
+        self._spool_dir = os.environ.get(self.SPOOL_DIR_ENV)
+        self.is_worker = self._spool_dir is not None
+        if not self.is_worker:
+            self._spool_dir = tempfile.mkdtemp(prefix='metrics-')
+            os.environ[self.SPOOL_DIR_ENV] = self._spool_dir
+            atexit.register(shutil.rmtree, self._spool_dir, ignore_errors=True)
+
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset_in_child)
+
+    def _reset_in_child(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._dirty = False
+        self._spool_name = uuid.uuid4().hex
+        self._summary_thread = None
+        self.is_worker = True
+
+    def inc(self, name, value=1, **labels):
+        key = name, tuple(sorted(labels.items()))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+            self._dirty = True
+
+    def observe(self, name, value, **labels):
+        key = name, tuple(sorted(labels.items()))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+            self._dirty = True
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        """Observe the seconds spent in the block, the yielded timer keeps its time.time() start for the logs."""
+        timer = Timer()
+        try:
+            yield timer
+        finally:
+            self.observe(name, time.perf_counter() - timer.perf_start, **labels)
+
+    def flush(self):
+        """Make the metrics of a worker seen by the root process, called when a worker finishes a task."""
+        if not self.is_worker or not self._dirty:
+            return
+
+        with self._lock:
+            data = pickle.dumps((self._counters, self._histograms), protocol=5)
+            self._dirty = False
+
+        path = os.path.join(self._spool_dir, f'{self._spool_name}.pickle')
+        tmp_path = f'{path}.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            self._logger.warning(f'Unable to flush metrics to {path}', show_pid=True)
+
+    def collect(self):
+        """Counters and histograms of this process merged with the ones flushed by workers."""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {}
+            self._merge_histograms(histograms, self._histograms)
+
+        if self.is_worker or not os.path.isdir(self._spool_dir):
+            return counters, histograms
+
+        for file_name in os.listdir(self._spool_dir):
+            if not file_name.endswith('.pickle'):
+                continue
+            try:
+                with open(os.path.join(self._spool_dir, file_name), 'rb') as f:
+                    worker_counters, worker_histograms = pickle.load(f)
+            except (OSError, EOFError, pickle.UnpicklingError):
+                continue
+
+            for key, value in worker_counters.items():
+                counters[key] = counters.get(key, 0) + value
+            self._merge_histograms(histograms, worker_histograms)
+
+        return counters, histograms
+
+    @staticmethod
+    def _merge_histograms(histograms, others):
+        for key, other in others.items():
+            histogram = histograms.get(key)
+            if histogram is None:
+                histogram = histograms[key] = Histogram()
+            histogram.merge(other)
+
+    def get_summary(self):
+        """Totals and rates of the counters, percentiles of the histograms, per name and per name and labels."""
+        counters, histograms = self.collect()
+        elapsed = max(time.time() - self._start_time, 1e-9)
+
+        name_to_total = {}
+        for (name, _), value in counters.items():
+            name_to_total[name] = name_to_total.get(name, 0) + value
+
+        name_to_histogram = {}
+        for (name, labels), histogram in histograms.items():
+            self._merge_histograms(name_to_histogram, {name: histogram})
+
+        return {
+            'elapsed': elapsed,
+            'counters': {name: {'total': total, 'rate': total / elapsed}
+                         for name, total in sorted(name_to_total.items())},
+            'timers': {name: histogram.to_json() for name, histogram in sorted(name_to_histogram.items())},
+            'series': {
+                'counters': [{'name': name, 'labels': dict(labels), 'total': value}
+                             for (name, labels), value in counters.items()],
+                'timers': [dict(name=name, labels=dict(labels), **histogram.to_json())
+                           for (name, labels), histogram in histograms.items()]
+            }
+        }
+
+    def log_summary(self):
+        summary = self.get_summary()
+
+        lines = [f'Metrics after {int(summary["elapsed"])}s:']
+        for name, counter in summary['counters'].items():
+            lines.append(f'  {name}: {counter["total"]} ({counter["rate"]:.2f}/s)')
+        for name, timer in summary['timers'].items():
+            lines.append(f'  {name}: n={timer["count"]}, p50={int(timer["p50"] * 1000)}ms, '
+                         f'p95={int(timer["p95"] * 1000)}ms, max={int(timer["max"] * 1000)}ms, '
+                         f'total={timer["sum"]:.1f}s')
+        self._logger.warning('\n'.join(lines))
+
+        if self.DUMP_PATH:
+            try:
+                with open(self.DUMP_PATH, 'w') as f:
+                    json.dump(summary, f, indent=2, default=str)
+            except OSError:
+                self._logger.warning(f'Unable to dump metrics to {self.DUMP_PATH}')
+
+    def start_summaries(self):
+        """Log a summary every SUMMARY_INTERVAL seconds and a last one on exit."""
+        if self._summary_thread is not None or not self.SUMMARY_INTERVAL:
+            return
+
+        self._summary_thread = threading.Thread(target=self._log_summaries, name='metrics-summaries', daemon=True)
+        self._summary_thread.start()
+        atexit.register(self.stop_summaries)
+
+    def stop_summaries(self):
+        if self._summary_thread is None:
+            return
+
+        self._summaries_stopped.set()
+        self._summary_thread.join()
+        self._summary_thread = None
+        self.log_summary()
+
+    def _log_summaries(self):
+        while not self._summaries_stopped.wait(self.SUMMARY_INTERVAL):
+            try:
+                self.log_summary()
+            except Exception:
+                self._logger.error('Unable to log metrics', exc_info=True)
+
+
+class Timer:
+    def __init__(self):
+        self.start = time.time()
+        self.perf_start = time.perf_counter()
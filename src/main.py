@@ -1,12 +1,12 @@
 import os
 import argparse
 import multiprocessing
-import pickle
 import sys
 
 import adaflowgraph
 import changegraph
-from log import logger
+from changegraph import storage
+from log import logger, metrics
 from vcs.traverse import GitAnalyzer
 from patterns import Miner
 import settings
@@ -17,11 +17,20 @@ class RunModes:
     COLLECT_CHANGE_GRAPHS = 'collect-cgs'
     CHANGE_GRAPHS_INFO = 'cgs-info'
     MINE_PATTERNS = 'patterns'
-    ALL = [BUILD_ADA_FLOW_GRAPH, BUILD_CHANGE_GRAPH, COLLECT_CHANGE_GRAPHS, MINE_PATTERNS]
+    INDEX_PATTERN_PARTITIONS = 'patterns-index'
+    MINE_PATTERN_PARTITION = 'patterns-unit'
+    MERGE_PATTERN_PARTITIONS = 'patterns-merge'
+    FILTER_PATTERNS = 'patterns-filter'
+    PRINT_PATTERNS = 'patterns-print'
+    RENDER_PATTERN_GRAPHS = 'patterns-render'
+    ALL = [BUILD_ADA_FLOW_GRAPH, BUILD_CHANGE_GRAPH, COLLECT_CHANGE_GRAPHS, MINE_PATTERNS,
+           INDEX_PATTERN_PARTITIONS, MINE_PATTERN_PARTITION, MERGE_PATTERN_PARTITIONS, FILTER_PATTERNS, PRINT_PATTERNS,
+           RENDER_PATTERN_GRAPHS]
 
 
 def main():
     logger.info('------------------------------ Starting ------------------------------')
+    metrics.start_summaries()
 
     multiprocessing.set_start_method('spawn', force=True)
 
@@ -63,11 +72,37 @@ def main():
 
         miner = Miner()
         try:
-            miner.mine_patterns(change_graphs_from_disk())
+            if Miner.PARTITIONED:
+                miner.mine_patterns_partitioned(change_graphs_from_disk)
+            elif Miner.STREAMING_SEEDS:
+                miner.mine_patterns_streaming(change_graphs_from_disk)
+            else:
+                miner.mine_patterns(change_graphs_from_disk())
         except KeyboardInterrupt:
             logger.warning('KeyboardInterrupt: mined patterns will be stored before exit.')
         
         miner.print_patterns()
+    # partitioned mining stages, units may run on different machines sharing patterns_partitions_dir
+    elif current_mode == RunModes.INDEX_PATTERN_PARTITIONS:
+        Miner().index_partitions(change_graphs_from_disk)
+    # for example: patterns-unit -p 3
+    elif current_mode == RunModes.MINE_PATTERN_PARTITION:
+        parser.add_argument('-p', '--partition', help='Number of the seed partition', type=int, required=True)
+        args = parser.parse_args()
+
+        Miner().mine_partition(args.partition)
+    elif current_mode == RunModes.MERGE_PATTERN_PARTITIONS:
+        miner = Miner()
+        miner.merge_partitions()
+        miner.print_patterns()
+    # stages over the pattern store of patterns_store_dir, e.g. after an interrupted mining run
+    elif current_mode == RunModes.FILTER_PATTERNS:
+        Miner().filter_stored_patterns()
+    elif current_mode == RunModes.PRINT_PATTERNS:
+        Miner().print_patterns()
+    # renders the .dot files printed with patterns_render_graphs off
+    elif current_mode == RunModes.RENDER_PATTERN_GRAPHS:
+        Miner().render_graphs()
     elif current_mode == 'test':
         sizes = []
         for graph in change_graphs_from_disk():
@@ -81,25 +116,17 @@ def main():
 
 
 def change_graphs_from_disk():
-    storage_dir = settings.get('change_graphs_storage_dir')
-    dir_names = os.listdir(storage_dir)
-
-    for dir_num, dir_name in enumerate(dir_names):
-        dir_path = os.path.join(storage_dir, dir_name)
-        file_names = os.listdir(dir_path)
-        logger.warning(f'Loading project [{1 + dir_num}/{len(dir_names)}].')
-        for file_num, file_name in enumerate(file_names):
-            file_path = os.path.join(dir_path, file_name)
-            try:
-                with open(file_path, 'rb') as f:
-                    graph = pickle.load(f)
-
-                    if len(graph.nodes) > 100:
-                        logger.warning(f'Skipping graph with size {len(graph.nodes)}.')
-                        continue
-                    yield graph
-            except:
-                logger.warning(f'Incorrect file {file_path}.')
+    for file_path in storage.iter_graph_paths():
+        try:
+            graph = storage.load_graph(file_path)
+        except:
+            logger.warning(f'Incorrect file {file_path}.')
+            continue
+
+        if len(graph.nodes) > 100:
+            logger.warning(f'Skipping graph with size {len(graph.nodes)}.')
+            continue
+        yield graph
 
 
 def change_graphs_info(graphs):
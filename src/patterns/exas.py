@@ -17,40 +17,33 @@ class ExasFeature:
     """
     MAX_LENGTH = 2 ** 3 - 1
 
-    def __init__(self, nodes=None):
-        self.node_label_to_feature_id = {}
-        self.edge_label_to_feature_id = {
-            LinkType.QUALIFIER: 0,
-            LinkType.CONDITION: 1,
-            LinkType.CONTROL: 2,
-            LinkType.DEFINITION: 3,
-            LinkType.MAP: 4,
-            LinkType.PARAMETER: 5,
-            LinkType.RECEIVER: 6,
-            LinkType.REFERENCE: 7
-        }
-
-        if nodes is not None:
-            self._bind_node_feature_ids(nodes)
-
-    def _bind_node_feature_ids(self, nodes):
-        for num, node in enumerate(nodes):
-            self.node_label_to_feature_id[node.label] = num + 1  # some ids can be skipped
-
-    def get_id_by_label(self, label):
-        return self.node_label_to_feature_id.get(label)
-
-    def get_id_by_labels(self, labels):
-        result = 0
-
-        for num, label in enumerate(labels):
-            if num % 2 == 0:
-                s = self.node_label_to_feature_id.get(label)
-            else:
-                s = self.edge_label_to_feature_id.get(label, 0)
-                s = normalize(s << 5)  # 2^4 types
-                result = normalize(result << 8)
-
-            result = normalize(result + s)
-
-        return result
+    EDGE_LABEL_TO_FEATURE_ID = {
+        LinkType.QUALIFIER: 0,
+        LinkType.CONDITION: 1,
+        LinkType.CONTROL: 2,
+        LinkType.DEFINITION: 3,
+        LinkType.MAP: 4,
+        LinkType.PARAMETER: 5,
+        LinkType.RECEIVER: 6,
+        LinkType.REFERENCE: 7
+    }
+
+    # features are keyed by the labels themselves: a node label for a single node and a tuple of the node labels
+    # and edge ids for a path. Unlike packing ids into an int, the keys never collide, and vectors built by
+    # different worker processes agree without a shared id table.
+    # Both are interned per process, so the many vectors holding a feature share one key object.
+    _path_features = {}
+
+    @classmethod
+    def get_id_by_label(cls, label):
+        return sys.intern(label)
+
+    @classmethod
+    def get_id_by_labels(cls, labels):
+        if len(labels) == 1:
+            return sys.intern(labels[0])
+
+        edge_label_to_feature_id = cls.EDGE_LABEL_TO_FEATURE_ID
+        feature = tuple(sys.intern(label) if num % 2 == 0 else edge_label_to_feature_id.get(label, 0)
+                        for num, label in enumerate(labels))
+        return cls._path_features.setdefault(feature, feature)
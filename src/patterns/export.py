@@ -0,0 +1,107 @@
+import json
+import os
+
+from changegraph.models import ChangeNode
+
+
+class NdjsonExporter:
+    """
+    Patterns as NDJSON, one record per line, flushed after every write so that readers can follow the file
+    while it grows. Records hold the nodes and edges of the representative fragment and, per instance,
+    the repository, commit, files, methods and the source spans of the fragment nodes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def create(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        open(self.path, 'w').close()
+
+    def write(self, patterns):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            for pattern in patterns:
+                f.write(json.dumps(self.to_json(pattern), ensure_ascii=False))
+                f.write('\n')
+
+    @classmethod
+    def to_json(cls, pattern):
+        fragment = pattern.repr
+        positions = {node.index: position for position, node in enumerate(fragment.nodes)}
+
+        edges = []
+        for node in fragment.nodes:
+            for e in node.out_edges:
+                if fragment.has_node(e.node_to):
+                    edges.append({'from': positions[node.index], 'to': positions[e.node_to.index], 'label': e.label})
+
+        return {
+            'id': pattern.id,
+            'size': pattern.size,
+            'freq': pattern.freq,
+            'nodes': [{
+                'label': node.label,
+                'original_label': node.original_label,
+                'kind': node.kind,
+                'sub_kind': node.sub_kind,
+                'version': node.version
+            } for node in fragment.nodes],
+            'edges': edges,
+            'instances': [cls._instance_to_json(instance, is_repr=instance is fragment)
+                          for instance in pattern.fragments]
+        }
+
+    @classmethod
+    def _instance_to_json(cls, fragment, is_repr=False):
+        result = {
+            'repr': is_repr,
+            'graph': fragment.graph.id,
+            'nodes': [{
+                'index': node.index,
+                'version': node.version,
+                'spans': cls._get_spans(node)
+            } for node in fragment.nodes]
+        }
+
+        repo_info = fragment.graph.repo_info
+        if repo_info is None:
+            return result
+
+        result.update({
+            'repo': {
+                'name': repo_info.repo_name,
+                'url': repo_info.repo_url
+            },
+            'commit': {
+                'hash': repo_info.commit_hash,
+                'dtm': repo_info.commit_dtm.isoformat() if repo_info.commit_dtm else None
+            },
+            'files': {
+                'old': repo_info.old_file_path,
+                'new': repo_info.new_file_path
+            },
+            'methods': {
+                'old': cls._method_to_json(repo_info.old_method),
+                'new': cls._method_to_json(repo_info.new_method)
+            }
+        })
+        return result
+
+    @staticmethod
+    def _method_to_json(method):
+        sloc_range = getattr(method, 'sloc_range', None)
+        return {
+            'full_name': method.full_name,
+            'sloc_range': str(sloc_range) if sloc_range else None,
+            'byte_span': getattr(method, 'byte_span', None)
+        }
+
+    @staticmethod
+    def _get_spans(node):
+        """Spans in the method text, the ones highlighted in the HTML samples."""
+        intervals = node.get_property(ChangeNode.Property.SYNTAX_TOKEN_INTERVALS)
+        if intervals is not None:
+            return [list(interval) for interval in intervals]
+
+        start = getattr(node, 'start_pos', None)
+        return [[start, node.end_pos]] if start is not None else []
@@ -1,17 +1,16 @@
 import copy
-import sys
 import time
 import multiprocessing
-import functools
+import multiprocessing.util
 
-from typing import Set, Optional, Dict, FrozenSet, Tuple
+from typing import Set, Optional, Dict, FrozenSet, Tuple, List
 
-from log import logger
+from log import logger, metrics
 from adaflowgraph.models import LinkType, Node
+from changegraph.arena import GraphArena
 from changegraph.models import ChangeNode
 from patterns.exas import ExasFeature, normalize
 import settings
-import vb_utils
 
 
 class CharacteristicVector:
@@ -21,24 +20,32 @@ class CharacteristicVector:
 
     def __init__(self):
         self.data = {}
+        self._hash = 0  # order independent sum over the (feature, count) pairs, kept up to date by add_feature
 
     def add_feature(self, feature_id):
-        self.data[feature_id] = self.data.get(feature_id, 0) + 1
+        count = self.data.get(feature_id, 0)
+        if count:
+            self._hash -= hash((feature_id, count))
+        self.data[feature_id] = count + 1
+        self._hash += hash((feature_id, count + 1))
 
     def get_hash(self):
-        logger.log(logger.DEBUG, f'Getting vector hash, data size = {len(self.data)}')
+        return normalize(self._hash)
 
-        result = 0
-        for key in sorted(self.data.keys()):
-            result = normalize(result * 31 + self.data[key])
-
-        logger.log(logger.DEBUG, f'Hash calculated, value = {result}')
-        return result
+    @classmethod
+    def create_from_data(cls, data):
+        """Vector with the given (feature, count) pairs."""
+        o = cls()
+        for feature_id, count in data:
+            o.data[feature_id] = count
+            o._hash += hash((feature_id, count))
+        return o
 
     def __copy__(self):
         cls = self.__class__
         o = cls.__new__(cls)
         o.data = copy.copy(self.data)
+        o._hash = self._hash
         return o
 
 
@@ -56,53 +63,56 @@ class Fragment:
         Fragment._FRAGMENT_ID += 1
         self.id = Fragment._FRAGMENT_ID
 
-        self.id_sum = 0  # boosting fragment comparision todo: int overflow?
-
         self.parent = None
         self.graph = None
         self.nodes = []
+        self.node_bits = 0  # bit node.index is set for every node of the fragment
         self.vector = CharacteristicVector()
 
     @property
     def size(self):
         return len(self.nodes)
 
+    def _add_node(self, node):
+        self.nodes.append(node)
+        self.node_bits |= 1 << node.index
+
+    def has_node(self, node):
+        """Membership of a node of the fragment's graph."""
+        return self.node_bits >> node.index & 1 == 1
+
+    def _same_graph(self, fragment):
+        return self.graph is fragment.graph or self.graph.id == fragment.graph.id
+
     @classmethod
     def create_from_node(cls, node):
         f = Fragment()
-        f.nodes.append(node)
         f.graph = node.graph
-
-        f.id_sum = node.id
+        f._add_node(node)
 
         f.__init_vector(node)
 
         return f
 
     def __init_vector(self, node):
-        exas_feature = ExasFeature(nodes=[node])
-        self.vector.add_feature(exas_feature.get_id_by_label(node.label))
+        self.vector.add_feature(ExasFeature.get_id_by_label(node.label))
 
     @classmethod
     def create_from_node_pair(cls, pair):
         f = Fragment()
-        f.nodes.append(pair[0])
-        f.nodes.append(pair[1])
         f.graph = pair[0].graph
-
-        f.id_sum = pair[0].id + pair[1].id
+        f._add_node(pair[0])
+        f._add_node(pair[1])
 
         f.__init_vector_from_pair(pair)
 
         return f
 
     def __init_vector_from_pair(self, pair):
-        exas_feature = ExasFeature(nodes=[pair[0], pair[1]])
-
-        self.vector.add_feature(exas_feature.get_id_by_label(pair[0].label))
-        self.vector.add_feature(exas_feature.get_id_by_label(pair[1].label))
+        self.vector.add_feature(ExasFeature.get_id_by_label(pair[0].label))
+        self.vector.add_feature(ExasFeature.get_id_by_label(pair[1].label))
 
-        self.vector.add_feature(exas_feature.get_id_by_labels(labels=[pair[0].label, LinkType.MAP, pair[1].label]))
+        self.vector.add_feature(ExasFeature.get_id_by_labels(labels=[pair[0].label, LinkType.MAP, pair[1].label]))
 
     @classmethod
     def create_extended(cls, fragment, ext_nodes: tuple):
@@ -111,49 +121,42 @@ class Fragment:
         f.graph = fragment.graph
 
         f.nodes = copy.copy(fragment.nodes)
+        f.node_bits = fragment.node_bits
         f.vector = copy.copy(fragment.vector)
 
-        f.id_sum = fragment.id_sum
         for node in ext_nodes:
-            f.id_sum += node.id
-            f.nodes.append(node)
-
-            logger.debug(f'Recalc vector for fragment {fragment} with node {node}', show_pid=True)
-            f.__recalc_vector(node, f.nodes)
+            f._add_node(node)
+            f.__recalc_vector(node)
 
         return f
 
-    def __recalc_vector(self, node, ext_by_one_nodes):
-        exas_feature = ExasFeature(nodes=ext_by_one_nodes)
+    def __recalc_vector(self, node):
+        # only the paths through the new node are new features, the parent's vector already has the rest
         sequence = [node.label]
-        self.__exas_backward_dfs(node, node, sequence, exas_feature)
+        self.__exas_backward_dfs(node, node, sequence)
 
-    def __exas_backward_dfs(self, first_node, last_node, sequence, exas_feature):
-        logger.debug('Entering backward dfs', show_pid=True)
-        self.__exas_forward_dfs(last_node, sequence, exas_feature)
+    def __exas_backward_dfs(self, first_node, last_node, sequence):
+        self.__exas_forward_dfs(last_node, sequence)
 
         if len(sequence) < ExasFeature.MAX_LENGTH:
             for e in first_node.in_edges:
-                if e.node_from in self.nodes:
+                if self.has_node(e.node_from):
                     sequence.insert(0, e.label)
                     sequence.insert(0, e.node_from.label)
-                    self.__exas_backward_dfs(e.node_from, last_node, sequence, exas_feature)
+                    self.__exas_backward_dfs(e.node_from, last_node, sequence)
                     del sequence[0]
                     del sequence[0]
 
-    def __exas_forward_dfs(self, node, sequence, exas_feature):
-        logger.debug('Entering forward dfs', show_pid=True)
-        logger.debug(f'Adding a feature for sequence: {sequence}', show_pid=True)
-
-        feature_id = exas_feature.get_id_by_labels(sequence)
+    def __exas_forward_dfs(self, node, sequence):
+        feature_id = ExasFeature.get_id_by_labels(sequence)
         self.vector.add_feature(feature_id)
 
         if len(sequence) < ExasFeature.MAX_LENGTH:
             for e in node.out_edges:
-                if e.node_to in self.nodes:
+                if self.has_node(e.node_to):
                     sequence.append(e.label)
                     sequence.append(e.node_to.label)
-                    self.__exas_forward_dfs(e.node_to, sequence, exas_feature)
+                    self.__exas_forward_dfs(e.node_to, sequence)
                     del sequence[-1]
                     del sequence[-1]
 
@@ -161,14 +164,14 @@ class Fragment:
         adjacent_nodes = set()
         for node in self.nodes:
             for in_node in node.get_in_nodes(excluded_labels=[LinkType.MAP]):
-                if in_node not in self.nodes:
+                if not self.has_node(in_node):
                     adjacent_nodes.add(in_node)
 
             for out_node in node.get_out_nodes(excluded_labels=[LinkType.MAP]):
-                if out_node not in self.nodes:
+                if not self.has_node(out_node):
                     adjacent_nodes.add(out_node)
 
-        logger.info(f'Adjacent nodes cnt = {len(adjacent_nodes)}')
+        logger.info('Adjacent nodes cnt = %s', len(adjacent_nodes))
 
         label_to_extensions: Dict[str, Set[Tuple]] = {}
         for node in adjacent_nodes:
@@ -179,7 +182,7 @@ class Fragment:
                     defs = node.get_definitions()
                     if not defs:
                         non_refs = node.get_out_nodes(excluded_labels=[LinkType.REFERENCE, LinkType.MAP])
-                        if non_refs.intersection(set(self.nodes)):
+                        if any(self.has_node(n) for n in non_refs):
                             self._add_extension(label_to_extensions, node)
                         else:
                             for next_node in non_refs:
@@ -231,20 +234,8 @@ class Fragment:
         out_nodes = node.get_out_nodes(excluded_labels=[LinkType.MAP])
 
         if in_nodes and out_nodes:
-            found = False
-            for n in in_nodes:
-                if n in self.nodes:
-                    found = True
-                    break
-
-            if found:
-                found = False
-                for n in out_nodes:
-                    if n in self.nodes:
-                        found = True
-                        break
-
-                if found:
+            if any(self.has_node(n) for n in in_nodes):
+                if any(self.has_node(n) for n in out_nodes):
                     self._add_extension(label_to_exts, node)
                 else:
                     for next_node in out_nodes:
@@ -255,76 +246,78 @@ class Fragment:
 
     def _add_out_node(self, label_to_exts, node):
         out_nodes = node.get_out_nodes(excluded_labels=[LinkType.MAP])
-        if out_nodes.intersection(set(self.nodes)):
+        if any(self.has_node(n) for n in out_nodes):
             self._add_extension(label_to_exts, node)
 
     @classmethod
     def create_groups(cls, fragments: set):
+        """
+        Group fragments with equal characteristic vectors in one pass over them,
+        dropping fragments that cover the same nodes of the same graph as one already in the group.
+        Fragments are bucketed by the incremental vector hash, vectors are only compared within a bucket.
+        """
         groups: Set[FrozenSet[Fragment]] = set()
 
-        hash_to_fragments: Dict[int, Set[Fragment]] = cls._get_hash_to_fragments(fragments)
-        logger.info(f'Done hash calculations, buckets={len(hash_to_fragments.keys())}', show_pid=True)
-
-        for key, fragments in hash_to_fragments.items():
-            logger.debug(f'Bucket hash = {key}', show_pid=True)
-            groups = groups.union(cls._group_same_hash_fragments(fragments))  # do grouping within calculated hash
-        return groups
-
-    @classmethod
-    def _group_same_hash_fragments(cls, fragments: set):
-        groups: Set[FrozenSet[Fragment]] = set()
-        while len(fragments) > 0:
-            fragment = next(iter(fragments))
-            fragments.remove(fragment)
-
-            group: Set[Fragment] = set()
-            group.add(fragment)
-
-            for fr in copy.copy(fragments):
-                if fragment.vector.data == fr.vector.data:
-                    group.add(fr)
-                    fragments.remove(fr)
-
-            # TODO: in the source there are also genesis fragments' groups checks, why?
-            if len(group) >= Pattern.MIN_FREQUENCY:
-                group: Set[Fragment] = cls._remove_duplicates(group)
-                if len(group) >= Pattern.MIN_FREQUENCY:
-                    logger.log(logger.INFO, f'A new group has been created, len = {len(group)}', show_pid=True)
-                    groups.add(frozenset(group))
+        hash_to_groups: Dict[int, List[Tuple[Dict, Dict[Tuple, Fragment]]]] = {}
+        for fragment in fragments:
+            bucket = hash_to_groups.setdefault(fragment.vector.get_hash(), [])
+            for vector_data, node_key_to_fragment in bucket:
+                if vector_data == fragment.vector.data:
+                    break
+            else:
+                node_key_to_fragment = {}
+                bucket.append((fragment.vector.data, node_key_to_fragment))
+            node_key_to_fragment.setdefault(fragment.get_node_key(), fragment)
+        logger.info('Done vector grouping, buckets=%s', len(hash_to_groups), show_pid=True)
+
+        for bucket in hash_to_groups.values():
+            for _, node_key_to_fragment in bucket:
+                if len(node_key_to_fragment) >= Pattern.MIN_FREQUENCY:
+                    logger.info('A new group has been created, len = %s', len(node_key_to_fragment), show_pid=True)
+                    groups.add(frozenset(node_key_to_fragment.values()))
         return groups
 
-    @staticmethod
-    def _remove_duplicates(group):
-        if len(group) < Pattern.MIN_FREQUENCY:
-            return group
+    def to_ref(self):
+        """Graph path and node indexes, enough to rebuild the fragment in any process that can load the graph."""
+        return self.graph.path, tuple(node.index for node in self.nodes)
 
-        lst = list(group)  # todo escape convertions
-        vb_utils.filter_list(lst, condition=lambda i, j: lst[i].is_equal(lst[j]))
-        logger.log(logger.INFO, f'Remove duplicates: affected {len(group) - len(lst)} items', show_pid=True)
+    @classmethod
+    def create_from_ref(cls, graph, node_indexes):
+        """Rebuild a fragment grown from a node pair from its to_ref() node indexes."""
+        nodes = [graph.node_list[index] for index in node_indexes]
+        f = cls.create_from_node_pair((nodes[0], nodes[1]))
+        if len(nodes) > 2:
+            f = cls.create_extended(f, tuple(nodes[2:]))
+        return f
 
-        return set(lst)
+    @classmethod
+    def create_with_vector(cls, graph, node_indexes, vector_data):
+        """Fragment over the given nodes of a graph whose vector is already known, no features are counted again."""
+        f = Fragment()
+        f.graph = graph
+        for index in node_indexes:
+            f._add_node(graph.node_list[index])
+        f.vector = CharacteristicVector.create_from_data(vector_data)
+        return f
 
-    @staticmethod
-    def _get_hash_to_fragments(fragments):
-        hash_to_fragments = {}
-        for fragment in fragments:
-            vector_hash = fragment.vector.get_hash()
-            s = hash_to_fragments.setdefault(vector_hash, set())
-            s.add(fragment)
-        return hash_to_fragments
+    def get_node_key(self):
+        """Fragments with equal node keys cover the same nodes of the same graph."""
+        return self.graph.id, self.node_bits
 
     def overlap(self, fragment):
-        intersection = set(self.nodes).intersection(set(fragment.nodes))  # todo: performance analysis
-        for node in intersection:
-            if node.sub_kind == ChangeNode.SubKind.OP_FUNC_CALL:
+        if not self._same_graph(fragment):
+            return False
+
+        common = self.node_bits & fragment.node_bits
+        while common:
+            lowest = common & -common
+            if self.graph.node_list[lowest.bit_length() - 1].sub_kind == ChangeNode.SubKind.OP_FUNC_CALL:
                 return True
+            common ^= lowest
         return False
 
     def is_equal(self, fragment):
-        if self.id_sum != fragment.id_sum:  # todo: performance analysis
-            return False
-
-        return set(self.nodes) == set(fragment.nodes)  # todo: performance analysis
+        return self.node_bits == fragment.node_bits and self._same_graph(fragment)
 
     def is_change(self):
         has_old = False
@@ -333,7 +326,7 @@ class Fragment:
         has_unmapped_change = False
         for node in self.nodes:
             if not has_unmapped_change and not \
-                    (node.mapped and node.mapped in self.nodes and node.label == node.mapped.label):
+                    (node.mapped and self.has_node(node.mapped) and node.label == node.mapped.label):
                 has_unmapped_change = True
 
             if node.version == Node.Version.BEFORE_CHANGES:
@@ -343,10 +336,10 @@ class Fragment:
         return has_unmapped_change and has_old and has_new
 
     def contains(self, fragment):
-        if self.id_sum < fragment.id_sum or self.size < fragment.size or self.graph.nodes != fragment.graph.nodes:
+        if self.size < fragment.size or not self._same_graph(fragment):
             return False
 
-        return set(fragment.nodes).issubset(set(self.nodes))
+        return fragment.node_bits & ~self.node_bits == 0
 
 
 class Pattern:
@@ -354,6 +347,9 @@ class Pattern:
     MIN_FREQUENCY = settings.get('patterns_min_frequency', 3)
     MAX_FREQUENCY = settings.get('patterns_max_frequency', 1000)
 
+    _arena: Optional[GraphArena] = None  # graphs shared with the async mode pool, see open_arena()
+    _pool = None
+
     def __init__(self, fragments, freq=None):
         self.id: Optional[int] = None  # unset until the pattern is not added to a miner
 
@@ -366,8 +362,25 @@ class Pattern:
     def size(self):
         return len(self.repr.nodes)
 
+    def to_ref(self):
+        """Frequency and fragment refs, the representative first; graphs are not included."""
+        fragments = [self.repr] + [fragment for fragment in self.fragments if fragment is not self.repr]
+        return self.freq, [fragment.to_ref() for fragment in fragments]
+
+    @classmethod
+    def create_from_ref(cls, ref, path_to_graph):
+        freq, fragment_refs = ref
+        fragments = [Fragment.create_from_ref(path_to_graph[path], node_indexes) for path, node_indexes in fragment_refs]
+
+        pattern = Pattern(set(fragments), freq)
+        pattern.repr = fragments[0]
+        return pattern
+
     def extend(self, iteration=1):
-        sys.setrecursionlimit(10000)
+        with metrics.timer('pattern_extend'):
+            return self._extend(iteration)
+
+    def _extend(self, iteration):
         current_pattern = self
 
         while True:
@@ -388,7 +401,9 @@ class Pattern:
             logger.warning(f'Dict label_to_fragment_to_ext_list with '
                            f'{len(label_to_fragment_to_ext_list.items())} items was constructed', start_time=start_time)
 
-            freq_group, freq = current_pattern._get_most_freq_group_and_freq(label_to_fragment_to_ext_list)
+            with metrics.timer('extension_lookup'):
+                freq_group, freq = current_pattern._get_most_freq_group_and_freq(label_to_fragment_to_ext_list)
+            metrics.inc('extension_lookups')
 
             if freq < Pattern.MIN_FREQUENCY:
                 logger.log(logger.WARNING, f'Done extend() for a pattern')
@@ -396,24 +411,48 @@ class Pattern:
 
             extended_pattern = Pattern(freq_group, freq)
 
-            new_nodes = []
-            for ix in range(len(current_pattern.repr.nodes), len(extended_pattern.repr.nodes)):
-                new_nodes.append(extended_pattern.repr.nodes[ix])
+            if logger.is_enabled_for(logger.INFO):
+                new_nodes = []
+                for ix in range(len(current_pattern.repr.nodes), len(extended_pattern.repr.nodes)):
+                    new_nodes.append(extended_pattern.repr.nodes[ix])
 
-            old_nodes_s = '\n' + '\n'.join([f'\t{node}' for node in current_pattern.repr.nodes]) + '\n'
-            new_nodes_s = '\n' + '\n'.join([f'\t{node}' for node in new_nodes]) + '\n'
+                old_nodes_s = '\n' + '\n'.join([f'\t{node}' for node in current_pattern.repr.nodes]) + '\n'
+                new_nodes_s = '\n' + '\n'.join([f'\t{node}' for node in new_nodes]) + '\n'
 
-            logger.info(f'Pattern with old nodes: {old_nodes_s}'
-                        f'was extended with new nodes: {new_nodes_s}'
-                        f'new size={extended_pattern.size}, '
-                        f'fragments cnt={len(extended_pattern.fragments)}, '
-                        f'iteration = {iteration}')
+                logger.info(f'Pattern with old nodes: {old_nodes_s}'
+                            f'was extended with new nodes: {new_nodes_s}'
+                            f'new size={extended_pattern.size}, '
+                            f'fragments cnt={len(extended_pattern.fragments)}, '
+                            f'iteration = {iteration}')
 
             current_pattern = extended_pattern
             iteration += 1
 
+    @classmethod
+    def open_arena(cls, graphs):
+        """
+        Pack the graphs into shared memory and start the pool the async mode runs on.
+        Both are kept for every extension until close_arena().
+        """
+        cls.close_arena()
+        cls._arena = GraphArena.create(graphs)
+        cls._pool = multiprocessing.Pool(processes=multiprocessing.cpu_count(), maxtasksperchild=1000,
+                                         initializer=_attach_arena,
+                                         initargs=(*cls._arena.get_attach_args(), logger.get_queue()))
+
+    @classmethod
+    def close_arena(cls):
+        if cls._pool is not None:
+            cls._pool.close()
+            cls._pool.join()
+            cls._pool = None
+
+        if cls._arena is not None:
+            cls._arena.close()
+            cls._arena.unlink()
+            cls._arena = None
+
     def _get_most_freq_group_and_freq(self, label_to_fragment_to_ext_list):
-        sys.setrecursionlimit(10000)
         logger.warning(f'Processing label_to_fragment_to_ext_list to get the most freq group')
         if not label_to_fragment_to_ext_list:
             return None, -1
@@ -424,18 +463,9 @@ class Pattern:
         freq: int = self.MIN_FREQUENCY - 1
 
         has_result = False
-        if self.DO_ASYNC_MINING:
+        if self.DO_ASYNC_MINING and self._pool is not None:
             try:
-                with multiprocessing.Pool(processes=multiprocessing.cpu_count(), maxtasksperchild=1000) as pool:
-                    fn = functools.partial(self._get_most_freq_group_and_freq_in_label,
-                                           len(label_to_fragment_to_ext_list))
-
-                    for curr_group, curr_freq in pool.imap_unordered(
-                            fn, enumerate(label_to_fragment_to_ext_list.items()), chunksize=1):
-
-                        if curr_freq > freq:  # todo plus lattice, getting most frequent group one more time
-                            freq_group = curr_group
-                            freq = curr_freq
+                freq_group, freq = self._get_most_freq_group_and_freq_async(label_to_fragment_to_ext_list)
                 has_result = True
             except:
                 logger.error('Unable to process freq groups in the async mode', exc_info=True)
@@ -452,8 +482,42 @@ class Pattern:
         logger.warning(f'The most freq group has freq={freq} and fr cnt={len(freq_group)}', start_time=start_time)
         return freq_group, freq
 
+    def _get_most_freq_group_and_freq_async(self, label_to_fragment_to_ext_list):
+        """
+        Tasks only carry graph numbers in the arena and node indexes, workers rebuild the fragments over their views
+        of the shared graphs and answer with positions, so the winning group is rebuilt here from our own fragments.
+        """
+        graph_numbers = self._arena.graph_numbers
+        labels_cnt = len(label_to_fragment_to_ext_list)
+
+        label_to_fragment_exts = []
+        tasks = []
+        for label_index, (label, fragment_to_ext_list) in enumerate(label_to_fragment_to_ext_list.items()):
+            fragment_exts = [(fragment, list(ext_list)) for fragment, ext_list in fragment_to_ext_list.items()]
+            label_to_fragment_exts.append(fragment_exts)
+
+            fragment_refs = [(graph_numbers[fragment.graph.id],
+                              tuple(node.index for node in fragment.nodes),
+                              list(fragment.vector.data.items()),
+                              [tuple(node.index for node in ext) for ext in ext_list])
+                             for fragment, ext_list in fragment_exts]
+            tasks.append((label_index, label, labels_cnt, self.size, len(self.fragments), fragment_refs))
+
+        freq_group: Set[Fragment] = set()
+        freq: int = self.MIN_FREQUENCY - 1
+        for label_index, group_refs, curr_freq in self._pool.imap_unordered(
+                _get_most_freq_group_ref_and_freq, tasks, chunksize=1):
+
+            if curr_freq > freq:  # todo plus lattice, getting most frequent group one more time
+                fragment_exts = label_to_fragment_exts[label_index]
+                freq_group = {Fragment.create_extended(fragment_exts[fragment_pos][0],
+                                                       fragment_exts[fragment_pos][1][ext_pos])
+                              for fragment_pos, ext_pos in group_refs}
+                freq = curr_freq
+
+        return freq_group, freq
+
     def _get_most_freq_group_and_freq_in_label(self, labels_cnt, data):
-        sys.setrecursionlimit(10000)
         label_index, (label, fragment_to_ext_list) = data
 
         ext_fragments = set()
@@ -462,35 +526,43 @@ class Pattern:
                 ext_fragment = Fragment.create_extended(fragment, ext)
                 ext_fragments.add(ext_fragment)
 
+        return self._get_most_freq_group_and_freq_in_ext_fragments(
+            self.size, len(self.fragments), label, label_index, labels_cnt, ext_fragments)
+
+    @classmethod
+    def _get_most_freq_group_and_freq_in_ext_fragments(cls, size, fragments_cnt,
+                                                        label, label_index, labels_cnt, ext_fragments):
         logger.warning(f'Extending for label #{label}# [{1 + label_index}/{labels_cnt}] '
                        f'ext fragments = {len(ext_fragments)}', show_pid=True)
 
-        is_giant = self._is_giant_extension(ext_fragments)
+        is_giant = cls._is_giant_extension(size, fragments_cnt, ext_fragments)
 
-        freq_group, freq = self._get_most_freq_group_and_freq_for_fragments(ext_fragments, is_giant)
-        logger.info(f'Got freq_group for label, freq={freq}, len={len(freq_group)}', show_pid=True)
+        freq_group, freq = cls._get_most_freq_group_and_freq_for_fragments(size, fragments_cnt, ext_fragments, is_giant)
+        logger.info('Got freq_group for label, freq=%s, len=%s', freq, len(freq_group), show_pid=True)
         return freq_group, freq
 
-    def _is_giant_extension(self, ext_fragments):
-        return self.size > 1 and \
+    @staticmethod
+    def _is_giant_extension(size, fragments_cnt, ext_fragments):
+        return size > 1 and \
                (len(ext_fragments) > Pattern.MAX_FREQUENCY or
-                len(ext_fragments) > len(self.fragments) * self.size * self.size)
+                len(ext_fragments) > fragments_cnt * size * size)
 
-    def _get_most_freq_group_and_freq_for_fragments(self, ext_fragments: set, is_giant):
+    @classmethod
+    def _get_most_freq_group_and_freq_for_fragments(cls, size, fragments_cnt, ext_fragments: set, is_giant):
         start = time.time()
         groups: Set[FrozenSet[Fragment]] = Fragment.create_groups(ext_fragments)
-        logger.log(logger.INFO, f'Groups for {len(ext_fragments)} fragments created', start_time=start, show_pid=True)
+        logger.info('Groups for %s fragments created', len(ext_fragments), start_time=start, show_pid=True)
 
         freq_group: Set[Fragment] = set()
-        freq = self.MIN_FREQUENCY - 1
+        freq = cls.MIN_FREQUENCY - 1
 
         for curr_group in groups:
-            overlapped_fragments: list = self.get_graph_overlapped_fragments(curr_group)
+            overlapped_fragments: list = cls.get_graph_overlapped_fragments(curr_group)
             curr_freq = len(curr_group) - len(overlapped_fragments)
 
             if curr_freq > freq:
                 curr_group = set(curr_group)
-                if is_giant and self._is_giant_extension(curr_group):
+                if is_giant and cls._is_giant_extension(size, fragments_cnt, curr_group):
                     for fragment in overlapped_fragments:
                         curr_group.remove(fragment)
 
@@ -503,6 +575,10 @@ class Pattern:
     def get_graph_overlapped_fragments(ext_fragments: frozenset):
         """
         Return fragments, which are overlapped in a graph by other fragments.
+
+        Fragments overlap when they share a function call node. Going through the fragments of a graph in order,
+        each fragment not overlapped itself hides the later ones sharing one of its call nodes, which are found
+        through an index from call nodes to fragments instead of comparing every pair.
         """
         graph_to_fragments = {}
         for fragment in ext_fragments:
@@ -511,11 +587,31 @@ class Pattern:
 
         overlapped_fragments = []
         for graph, fragments in graph_to_fragments.items():
-            vb_utils.filter_list(
-                fragments,
-                condition=lambda i, j: fragments[i].overlap(fragments[j]),
-                post_condition_fn=lambda i, j: overlapped_fragments.append(fragments[j])
-            )
+            fragment_call_nodes = []
+            call_node_to_positions: Dict[int, list] = {}
+            for position, fragment in enumerate(fragments):
+                call_nodes = [node.index for node in fragment.nodes
+                              if node.sub_kind == ChangeNode.SubKind.OP_FUNC_CALL]
+                fragment_call_nodes.append(call_nodes)
+                for index in call_nodes:
+                    call_node_to_positions.setdefault(index, []).append(position)
+
+            overlapped = [False] * len(fragments)
+            for position, call_nodes in enumerate(fragment_call_nodes):
+                if overlapped[position]:
+                    continue
+
+                # every later fragment sharing a call node with this one is hidden now,
+                # so no other fragment has to look at these call nodes again
+                hidden = set()
+                for index in call_nodes:
+                    for other in call_node_to_positions.pop(index, ()):
+                        if other > position and not overlapped[other]:
+                            hidden.add(other)
+
+                for other in sorted(hidden):
+                    overlapped[other] = True
+                    overlapped_fragments.append(fragments[other])
         return overlapped_fragments
 
     def is_change(self):
@@ -533,3 +629,39 @@ class Pattern:
                 if fragment1.contains(fragment2):
                     return True
         return False
+
+
+_arena: Optional[GraphArena] = None
+
+
+def _attach_arena(name, layout, tables, log_queue):
+    global _arena
+    _arena = GraphArena.attach(name, layout, tables)
+    logger.attach_queue(log_queue)
+
+    # run by the worker on exit, forked ones included unlike atexit hooks, so that the views of the block are
+    # released before the SharedMemory object is collected
+    multiprocessing.util.Finalize(None, _detach_arena, exitpriority=10)
+
+
+def _detach_arena():
+    global _arena
+    if _arena is not None:
+        _arena.close()
+        _arena = None
+
+
+def _get_most_freq_group_ref_and_freq(task):
+    label_index, label, labels_cnt, size, fragments_cnt, fragment_refs = task
+
+    ext_fragment_to_ref = {}
+    for fragment_pos, (graph_number, node_indexes, vector_data, ext_list) in enumerate(fragment_refs):
+        graph = _arena.get_graph(graph_number)
+        fragment = Fragment.create_with_vector(graph, node_indexes, vector_data)
+        for ext_pos, ext_indexes in enumerate(ext_list):
+            ext_fragment = Fragment.create_extended(fragment, tuple(graph.node_list[index] for index in ext_indexes))
+            ext_fragment_to_ref[ext_fragment] = (fragment_pos, ext_pos)
+
+    freq_group, freq = Pattern._get_most_freq_group_and_freq_in_ext_fragments(
+        size, fragments_cnt, label, label_index, labels_cnt, set(ext_fragment_to_ref))
+    return label_index, [ext_fragment_to_ref[fragment] for fragment in freq_group], freq
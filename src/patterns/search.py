@@ -1,20 +1,26 @@
 import os
-import re
 import shutil
 import hashlib
 import multiprocessing
 import multiprocessing.pool
-import functools
 import copy
 import html
 import json
 import datetime
+import collections
+import contextlib
+
+from typing import Optional
 
 import settings
 import changegraph
-from log import logger
+from log import logger, metrics, attach_log_queue
+from changegraph import storage
 from changegraph.models import ChangeNode
 from patterns.models import Fragment, Pattern
+from patterns.seeds import SeedIndex
+from patterns.store import PatternStore
+from patterns.export import NdjsonExporter
 
 
 class Miner:
@@ -27,6 +33,22 @@ class Miner:
     FULL_PRINT = settings.get('patterns_full_print', False)
     HIDE_OVERLAPPED_FRAGMENTS = settings.get('patterns_hide_overlapped_fragments', True)
 
+    DO_ASYNC_SEEDS = settings.get('patterns_async_seeds', False)
+    SEED_PROCESSES = settings.get('patterns_seed_processes', multiprocessing.cpu_count())
+
+    STREAMING_SEEDS = settings.get('patterns_streaming_seeds', False)
+    SEED_SPILL_DIR = settings.get('patterns_seed_spill_dir', required=False)
+    SEED_PARTITIONS = settings.get('patterns_seed_partitions', 16)
+    PARTITIONED = settings.get('patterns_partitioned', False)
+    PARTITIONS_DIR = settings.get('patterns_partitions_dir', required=False)
+    STORE_DIR = settings.get('patterns_store_dir', required=False)
+    EXPORT_PATH = settings.get('patterns_export_path', required=False)
+    PRINT_HTML = settings.get('patterns_print_html', True)
+
+    REPORT_PROCESSES = settings.get('patterns_report_processes', 1)
+    REPORT_CHUNK_SIZE = 4
+    RENDER_GRAPHS = settings.get('patterns_render_graphs', True)
+
     ID_OFFSET = settings.get('patterns_id_offset', 0)
     MIN_PATTERN_SIZE = settings.get('patterns_min_size', 3)
 
@@ -38,66 +60,285 @@ class Miner:
     def __init__(self):
         self._size_to_patterns = {}
         self._patterns_cnt = 0
+        self._store: Optional[PatternStore] = None  # mined patterns go there instead of memory when STORE_DIR is set
+        self._exporter: Optional[NdjsonExporter] = None  # mined patterns are also exported when EXPORT_PATH is set
 
     def add_pattern(self, pattern):
         self._patterns_cnt += 1
         pattern.id = self._patterns_cnt + self.ID_OFFSET
 
+        if self._exporter:
+            self._exporter.write([pattern])
+
+        if self._store:
+            self._store.append([pattern])
+            return
+
         patterns = self._size_to_patterns.setdefault(pattern.size, set())
         patterns.add(pattern)
 
     def mine_patterns(self, change_graphs, mining_level=1):
         if mining_level == 1:
+            self._open_outputs()
             self._mine(change_graphs)
         else:
             raise NotImplementedError
 
-    def _mine(self, graphs):
-        label_to_node_pairs = {}
+    def mine_patterns_streaming(self, load_change_graphs):
+        """
+        Mine in two passes over load_change_graphs(), which has to give the same stored graphs every time.
+
+        The first pass only counts seed labels. The second one keeps the seed pairs of the frequent labels
+        as (graph path, node indexes) refs in a SeedIndex, optionally spilled to disk partitions, so no graph
+        stays loaded between the passes. Seeds are then extended partition by partition, loading back
+        just the graphs they come from.
+        """
+        self._open_outputs()
+        seed_index = SeedIndex(self.SEED_SPILL_DIR, self.SEED_PARTITIONS)
+        try:
+            self._index_seeds(load_change_graphs, seed_index)
+
+            num = 0
+            for label_to_refs in seed_index.iter_partitions():
+                num = self._add_extended_seed_refs(label_to_refs, num)
+        finally:
+            seed_index.clear()
+
+        self._complete_mining()
+
+    def mine_patterns_partitioned(self, load_change_graphs):
+        """
+        Out-of-core mining: seed labels are sharded into the partitions of PARTITIONS_DIR, every partition is mined
+        as an independent unit in a pool process which stores its patterns and exits, and the stored patterns
+        are merged and filtered at the end. The stages can also run separately, see index_partitions(),
+        mine_partition() and merge_partitions(), e.g. on several machines sharing the directory.
+        """
+        self.index_partitions(load_change_graphs)
+
+        with multiprocessing.Pool(processes=self.SEED_PROCESSES, initializer=_init_partition_worker,
+                                  initargs=(logger.get_queue(),), maxtasksperchild=1) as pool:
+            for partition, patterns_cnt in pool.imap_unordered(_mine_partition, range(self.SEED_PARTITIONS)):
+                logger.warning(f'Done partition #{partition} with {patterns_cnt} patterns')
+
+        self.merge_partitions()
+
+    def index_partitions(self, load_change_graphs):
+        seed_index = SeedIndex(self._get_partitions_dir(), self.SEED_PARTITIONS)
+        self._index_seeds(load_change_graphs, seed_index)
+        seed_index.flush()
+
+    def mine_partition(self, partition):
+        """Extend the seeds of one partition and store the patterns, they are filtered only when merging."""
+        seed_index = SeedIndex(self._get_partitions_dir(), self.SEED_PARTITIONS, reset=False)
+        self._add_extended_seed_refs(seed_index.read_partition(partition), 0)
+
+        store = self._get_partition_store(partition)
+        store.create()
+        for patterns in self._size_to_patterns.values():
+            store.append(patterns)
+
+        logger.warning(f'Stored {self._patterns_cnt} patterns of partition #{partition}')
+        return self._patterns_cnt
+
+    def merge_partitions(self):
+        self._open_outputs()
+        path_to_graph = {}
+        for partition in range(self.SEED_PARTITIONS):
+            store = self._get_partition_store(partition)
+            if not store.exists():
+                logger.warning(f'Partition #{partition} has no stored patterns, it was not mined')
+                continue
+
+            for pattern in store.iter_patterns(path_to_graph):
+                self.add_pattern(pattern)
+            path_to_graph.clear()
+
+        self._complete_mining()
+
+    def _open_outputs(self):
+        if self.EXPORT_PATH:
+            self._exporter = NdjsonExporter(self.EXPORT_PATH)
+            self._exporter.create()
+
+        if self.STORE_DIR:
+            self._store = self._get_mined_store()
+            self._store.create()
+
+            filtered_store = self._get_filtered_store()
+            if filtered_store.exists():
+                os.remove(filtered_store.path)
+
+    def _get_mined_store(self):
+        return PatternStore(os.path.join(self._get_store_dir(), 'mined.pickle'))
+
+    def _get_filtered_store(self):
+        return PatternStore(os.path.join(self._get_store_dir(), 'filtered.pickle'))
+
+    def _get_store_dir(self):
+        if not self.STORE_DIR:
+            raise settings.SettingNotSet('Unable to read setting=patterns_store_dir')
+        return self.STORE_DIR
+
+    def filter_stored_patterns(self):
+        """
+        Filtering stage over the store: read the mined patterns size by size from the largest one, filter them
+        as _complete_mining() does in memory and write the result to the filtered store, which printing reads.
+        A pattern can only be contained in patterns of its size or larger, so the smaller sizes are not loaded
+        before their turn.
+        """
+        self._store = None
+        self._size_to_patterns = {}
+        self._patterns_cnt = 0
+
+        mined_store = self._get_mined_store()
+        sizes = sorted({mined_store.get_size(record) for record in mined_store.iter_records()}, reverse=True)
+
+        path_to_graph = {}
+        node_to_entries = {}
+        for size in sizes:
+            patterns = set(mined_store.iter_patterns(path_to_graph, size=size))
+            self._size_to_patterns[size] = patterns
+            self._patterns_cnt += len(patterns)
+            self._filter_patterns_of_size(size, node_to_entries)
+            logger.info(f'Filtered stored patterns of size {size}')
+        del node_to_entries
+
+        self._complete_filtering()
+
+        store = self._get_filtered_store()
+        store.create()
+        for patterns in self._size_to_patterns.values():
+            store.append(sorted(patterns, key=lambda p: p.id))
+
+        logger.warning(f'Stored {self._patterns_cnt} filtered patterns')
+        self._size_to_patterns = {}
+
+    def _get_partitions_dir(self):
+        if not self.PARTITIONS_DIR:
+            raise settings.SettingNotSet('Unable to read setting=patterns_partitions_dir')
+        return self.PARTITIONS_DIR
+
+    def _get_partition_store(self, partition):
+        return PatternStore(os.path.join(self._get_partitions_dir(), f'patterns-{partition}.pickle'))
+
+    def _index_seeds(self, load_change_graphs, seed_index):
+        label_to_cnt = collections.Counter()
+        for graph in self._iter_graphs(load_change_graphs()):
+            label_to_cnt.update(label for label, _ in self._get_seed_pairs(graph))
+
+        frequent_labels = {label for label, cnt in label_to_cnt.items() if cnt >= Pattern.MIN_FREQUENCY}
+        self.min_frequency_skip_count += len(label_to_cnt) - len(frequent_labels)
+        logger.warning(f'Total seed labels after the first pass = {len(label_to_cnt)}, '
+                       f'frequent = {len(frequent_labels)}')
+        del label_to_cnt
+
+        graph_cnt = 0
+        for graph in load_change_graphs():
+            if self._is_skipped(graph):
+                continue
+
+            has_seeds = False
+            for label, (before, after) in self._get_seed_pairs(graph):
+                if label in frequent_labels:
+                    if not graph.path:
+                        raise ValueError('Seed indexing needs graphs loaded from the storage')
+
+                    seed_index.add(label, (graph.path, before.index, after.index))
+                    has_seeds = True
+            graph_cnt += has_seeds
+        logger.warning(f'Seeds of {len(frequent_labels)} labels found in {graph_cnt} graphs')
+
+    def _add_extended_seed_refs(self, label_to_refs, num):
+        path_to_graph = {}
+        seeds = []
+        for refs in label_to_refs.values():
+            pairs = []
+            for path, before_index, after_index in refs:
+                graph = path_to_graph.get(path)
+                if graph is None:
+                    graph = path_to_graph[path] = storage.load_graph(path)
+                pairs.append((graph.node_list[before_index], graph.node_list[after_index]))
+            seeds.append((num, pairs))
+            num += 1
+
+        self._add_extended_seeds(seeds)
+        return num
+
+    def _iter_graphs(self, graphs):
         for graph in graphs:
             self.graph_count += 1
-            print(f'graph count: {self.graph_count}')
-            if self.MIN_DATE and graph.repo_info.commit_dtm < self.MIN_DATE:
+            metrics.inc('graphs')
+            logger.progress('graph count', self.graph_count)
+            if self._is_skipped(graph):
                 self.min_date_skip_count += 1
-                print(f'min date skip count: {self.min_date_skip_count}')
+                logger.progress('min date skip count', self.min_date_skip_count)
                 continue
+            yield graph
 
-            for node in graph.nodes:
-                if node.version != ChangeNode.Version.BEFORE_CHANGES or not node.mapped:
-                    continue
+        logger.progress_done('graph count')
+        logger.progress_done('min date skip count')
+
+    def _is_skipped(self, graph):
+        return self.MIN_DATE and graph.repo_info.commit_dtm < self.MIN_DATE
+
+    @staticmethod
+    def _get_seed_pairs(graph):
+        for node in graph.nodes:
+            if node.version != ChangeNode.Version.BEFORE_CHANGES or not node.mapped:
+                continue
+
+            # if not (node.kind == ChangeNode.Kind.OPERATION_NODE
+            #         and node.sub_kind == ChangeNode.SubKind.OP_FUNC_CALL):
+            #     # or node.kind == ChangeNode.Kind.CONTROL_NODE):
+            #     continue
 
-                # if not (node.kind == ChangeNode.Kind.OPERATION_NODE
-                #         and node.sub_kind == ChangeNode.SubKind.OP_FUNC_CALL):
-                #     # or node.kind == ChangeNode.Kind.CONTROL_NODE):
-                #     continue
+            yield f'{node.label}~{node.mapped.label}', (node, node.mapped)
 
-                label = f'{node.label}~{node.mapped.label}'
+    def _mine(self, graphs):
+        label_to_node_pairs = {}
+        for graph in self._iter_graphs(graphs):
+            for label, pair in self._get_seed_pairs(graph):
                 arr = label_to_node_pairs.setdefault(label, [])
-                arr.append((node, node.mapped))
+                arr.append(pair)
 
-        logger.warning(f'Total pairs after the first step = {len(label_to_node_pairs.values())}')
+        logger.warning(f'Total pairs after the first step = {len(label_to_node_pairs.values())} '
+                       f'from {self.graph_count} graphs, {self.min_date_skip_count} skipped by date')
 
+        seeds = []
         for num, pairs in enumerate(label_to_node_pairs.values()):
-            logger.warning(f'Looking at node pair #{num + 1}')
-
             if len(pairs) < Pattern.MIN_FREQUENCY:
                 self.min_frequency_skip_count += 1
-                logger.warning(f'Skipping... (min frequency skip count {self.min_frequency_skip_count})')
+                logger.progress('min frequency skip count', self.min_frequency_skip_count)
                 continue
+            seeds.append((num, pairs))
+        logger.progress_done('min frequency skip count')
 
-            fragments = set([Fragment.create_from_node_pair(pair) for pair in pairs])
-            pattern = Pattern(fragments, len(fragments))
-            pattern = pattern.extend()
+        self._add_extended_seeds(seeds)
+        self._complete_mining()
 
-            if pattern.is_change() and pattern.size >= self.MIN_PATTERN_SIZE:
+    def _add_extended_seeds(self, seeds):
+        if self.DO_ASYNC_SEEDS and all(pair[0].graph.path for _, pairs in seeds for pair in pairs):
+            extended_seeds = self._extend_seeds_async(seeds)
+        else:
+            extended_seeds = self._extend_seeds(seeds)
+
+        for num, pattern in extended_seeds:
+            if pattern:
                 self.add_pattern(pattern)
                 logger.warning(f'Pattern #{pattern.id} with size {pattern.size} was added')
 
             logger.warning(f'Done looking at node pair #{num + 1}')
 
+    def _complete_mining(self):
         logger.warning(f'Done patterns\' mining, total count = {self._patterns_cnt}')
+        if self._store:
+            self.filter_stored_patterns()
+            return
 
         self._filter_patterns()
+        self._complete_filtering()
+
+    def _complete_filtering(self):
         logger.warning(f'Done filtering, total count = {self._patterns_cnt}')
 
         if self.HIDE_OVERLAPPED_FRAGMENTS:
@@ -109,37 +350,125 @@ class Miner:
                         pattern.fragments.remove(fragment)
             logger.info('Done removing overlapped fragments from patterns')
 
+        if self.EXPORT_PATH:
+            self._export_filtered_patterns()
+
+    def _export_filtered_patterns(self):
+        """
+        Export the patterns left after filtering to <name>.filtered.ndjson next to EXPORT_PATH, which has every
+        mined pattern including the ones filtering dropped.
+        """
+        root, ext = os.path.splitext(self.EXPORT_PATH)
+        exporter = NdjsonExporter(f'{root}.filtered{ext}')
+        exporter.create()
+        for size in sorted(self._size_to_patterns.keys()):
+            exporter.write(sorted(self._size_to_patterns[size], key=lambda p: p.id))
+        logger.warning(f'Exported {self._patterns_cnt} filtered patterns to {exporter.path}')
+
+    @classmethod
+    def extend_seed(cls, pairs):
+        """Grow a pattern from the node pairs sharing a seed label, None if it is not worth keeping."""
+        fragments = set([Fragment.create_from_node_pair(pair) for pair in pairs])
+        pattern = Pattern(fragments, len(fragments))
+        pattern = pattern.extend()
+        metrics.inc('seeds')
+
+        if pattern.is_change() and pattern.size >= cls.MIN_PATTERN_SIZE:
+            metrics.inc('patterns')
+            return pattern
+        return None
+
+    def _extend_seeds(self, seeds):
+        if Pattern.DO_ASYNC_MINING:
+            graphs = {pair[0].graph.id: pair[0].graph for _, pairs in seeds for pair in pairs}
+            Pattern.open_arena(list(graphs.values()))
+            logger.warning(f'Shared {len(graphs)} graphs with the extension pool')
+
+        try:
+            for num, pairs in seeds:
+                logger.warning(f'Looking at node pair #{num + 1}')
+                yield num, self.extend_seed(pairs)
+        finally:
+            Pattern.close_arena()
+
+    def _extend_seeds_async(self, seeds):
+        """
+        Extend the seeds over one pool for the whole run. Tasks and results only carry graph paths and node indexes:
+        workers load each graph they need once, and patterns are rebuilt here from the graphs already in memory.
+        """
+        path_to_graph = {}
+        tasks = []
+        for num, pairs in seeds:
+            pair_refs = []
+            for before, after in pairs:
+                path_to_graph[before.graph.path] = before.graph
+                pair_refs.append((before.graph.path, before.index, after.index))
+            tasks.append((num, pair_refs))
+
+        logger.warning(f'Extending {len(tasks)} seeds in {self.SEED_PROCESSES} processes')
+        with multiprocessing.Pool(processes=self.SEED_PROCESSES, initializer=_init_seed_worker,
+                                  initargs=(logger.get_queue(),)) as pool:
+            for num, ref in pool.imap(_extend_seed_ref, tasks, chunksize=1):
+                yield num, Pattern.create_from_ref(ref, path_to_graph) if ref else None
+
     def _filter_patterns(self):
-        keys = sorted(self._size_to_patterns.keys())
-        cleared_keys = set()
-
-        for size1 in keys:
-            patterns = self._size_to_patterns[size1]
-
-            for pattern1 in copy.copy(patterns):
-                for size2 in keys:
-                    if size1 > size2:
-                        continue
-
-                    patterns2 = self._size_to_patterns[size2]
-                    found = False
-
-                    for pattern2 in patterns2:
-                        if pattern2 != pattern1 and pattern2.contains(pattern1):
-                            patterns.remove(pattern1)
-                            self._patterns_cnt -= 1
-                            if not patterns:
-                                cleared_keys.add(size1)
-                            found = True
-                            break
-
-                    if found:
-                        break
+        """
+        Drop the patterns contained in another pattern of the same or a larger size.
+
+        Containing fragments are looked up through an index from (graph id, node index) to the fragments covering
+        the node. A fragment containing another one covers all of its nodes, so the shortest posting list among
+        the nodes of a fragment already holds every candidate, and a bitset test settles each of them.
+        Sizes are filtered from the largest one, each against the sizes indexed before.
+        """
+        node_to_entries = {}
+        for size in sorted(self._size_to_patterns.keys(), reverse=True):
+            self._filter_patterns_of_size(size, node_to_entries)
+
+    def _filter_patterns_of_size(self, size, node_to_entries):
+        """
+        Index the patterns of size in node_to_entries and drop the ones contained in another pattern indexed there.
+        Patterns of larger sizes are containers even when they were dropped themselves, patterns of the same size
+        only while they are kept.
+        """
+        patterns = self._size_to_patterns[size]
+        for pattern in patterns:
+            for fragment in pattern.fragments:
+                for node in fragment.nodes:
+                    node_to_entries.setdefault((fragment.graph.id, node.index), []).append((pattern, fragment))
+
+        removed = set()
+        for pattern1 in copy.copy(patterns):
+            if self._is_contained(pattern1, node_to_entries, removed):
+                patterns.remove(pattern1)
+                removed.add(pattern1)
+                self._patterns_cnt -= 1
+
+        if not patterns:
+            self._size_to_patterns.pop(size)
+
+    @staticmethod
+    def _is_contained(pattern, node_to_entries, removed):
+        for fragment2 in pattern.fragments:
+            candidates = min((node_to_entries.get((fragment2.graph.id, node.index), ()) for node in fragment2.nodes),
+                             key=len)
+
+            for pattern2, fragment1 in candidates:
+                if pattern2 is pattern or pattern2 in removed or pattern2.size < pattern.size:
+                    continue
 
-        for k in cleared_keys:
-            self._size_to_patterns.pop(k)
+                if fragment1.contains(fragment2):
+                    return True
+        return False
 
     def print_patterns(self):
+        if not self.PRINT_HTML:
+            logger.warning('Printing patterns is off')
+            return
+
+        if self.STORE_DIR:
+            self._print_stored_patterns()
+            return
+
         if not self._size_to_patterns:
             logger.warning('No patterns were found')
             return
@@ -147,32 +476,103 @@ class Miner:
         if os.path.exists(self.OUTPUT_DIR):
             shutil.rmtree(self.OUTPUT_DIR)
 
-        for size, patterns in self._size_to_patterns.items():
-            if not patterns:
-                continue
+        with self._open_report_pool() as pool, metrics.timer('print_patterns'):
+            for size, patterns in self._size_to_patterns.items():
+                if pool and all(fragment.graph.path for pattern in patterns for fragment in pattern.fragments):
+                    self._print_records_of_size(size, [PatternStore.to_record(pattern) for pattern in patterns], pool)
+                else:
+                    self._print_patterns_of_size(size, patterns)
+                patterns.clear()
+
+        self._print_contents(self._size_to_patterns.keys())
+
+    def _print_stored_patterns(self):
+        """Printing stage over the store, loading the patterns of one size at a time."""
+        store = self._get_filtered_store()
+        if not store.exists():
+            store = self._get_mined_store()
+            logger.warning('Patterns were not filtered, printing all the mined ones')
+
+        sizes = sorted({PatternStore.get_size(record) for record in store.iter_records()}) if store.exists() else []
+        if not sizes:
+            logger.warning('No patterns were found')
+            return
+
+        if os.path.exists(self.OUTPUT_DIR):
+            shutil.rmtree(self.OUTPUT_DIR)
+
+        with self._open_report_pool() as pool, metrics.timer('print_patterns'):
+            for size in sizes:
+                if pool:
+                    self._print_records_of_size(size, list(store.iter_records_of_size(size)), pool)
+                else:
+                    self._print_patterns_of_size(size, list(store.iter_patterns({}, size=size)))
+
+        self._print_contents(sizes)
+
+    def _open_report_pool(self):
+        """
+        Pool printing pattern records when REPORT_PROCESSES > 1, each worker keeping the graphs it loaded
+        along with the method sloc ranges they memoize, otherwise a context giving None.
+        """
+        if self.REPORT_PROCESSES > 1:
+            return multiprocessing.Pool(processes=self.REPORT_PROCESSES,
+                                        initializer=attach_log_queue, initargs=(logger.get_queue(),))
+        return contextlib.nullcontext()
+
+    def _print_patterns_of_size(self, size, patterns):
+        if not patterns:
+            return
+
+        same_size_dir = self._create_size_dir(size)
+        for pattern in patterns:
+            self._print_pattern(same_size_dir, pattern)
+
+        self._generate_size_contents(same_size_dir, size, [pattern.id for pattern in patterns])
+
+    def _print_records_of_size(self, size, records, pool):
+        if not records:
+            return
 
-            logger.log(logger.WARNING, f'Exporting patterns of size {size}', show_pid=True)
+        same_size_dir = self._create_size_dir(size)
+        tasks = [(same_size_dir, record) for record in records]
+        pattern_ids = list(pool.imap_unordered(_print_pattern_record, tasks, chunksize=self.REPORT_CHUNK_SIZE))
 
-            same_size_dir = os.path.join(self.OUTPUT_DIR, str(size))
-            os.makedirs(same_size_dir, exist_ok=True)
+        self._generate_size_contents(same_size_dir, size, pattern_ids)
 
-            fn = functools.partial(self._print_pattern, same_size_dir)
-            for pattern in patterns:
-                fn(pattern)
+    def _create_size_dir(self, size):
+        logger.log(logger.WARNING, f'Exporting patterns of size {size}', show_pid=True)
 
-            self._generate_contents(
-                same_size_dir,
-                f'Size {size} contents',
-                [{'name': f'Pattern #{p.id}', 'url': f'{p.id}/details.html'}
-                 for p in sorted(patterns, key=lambda p: p.id)],
-                styles='../../styles.css', has_upper_contents=True)
-            patterns.clear()
+        same_size_dir = os.path.join(self.OUTPUT_DIR, str(size))
+        os.makedirs(same_size_dir, exist_ok=True)
+        return same_size_dir
 
+    def _generate_size_contents(self, same_size_dir, size, pattern_ids):
+        self._generate_contents(
+            same_size_dir,
+            f'Size {size} contents',
+            [{'name': f'Pattern #{pattern_id}', 'url': f'{pattern_id}/details.html'}
+             for pattern_id in sorted(pattern_ids)],
+            styles='../../styles.css', has_upper_contents=True)
+
+    def render_graphs(self):
+        """Render the .dot files printed without RENDER_GRAPHS and not rendered yet."""
+        dot_paths = []
+        for dir_path, _, file_names in os.walk(self.OUTPUT_DIR):
+            for file_name in file_names:
+                if file_name.endswith('.dot') and f'{file_name}.pdf' not in file_names:
+                    dot_paths.append(os.path.join(dir_path, file_name))
+
+        logger.warning(f'Rendering {len(dot_paths)} graphs')
+        changegraph.render_dot_files(dot_paths)
+        logger.warning('Done rendering graphs')
+
+    def _print_contents(self, sizes):
         self._generate_contents(
             self.OUTPUT_DIR,
             'Contents',
             [{'name': f'Size {size}', 'url': f'{size}/contents.html'}
-             for size in sorted(self._size_to_patterns.keys())])
+             for size in sorted(sizes)])
 
         logger.warning('Done patterns output')
 
@@ -201,6 +601,12 @@ class Miner:
 
     @classmethod
     def _print_pattern(cls, root_dir, pattern):
+        with metrics.timer('print_pattern'):
+            cls._print_pattern_files(root_dir, pattern)
+        metrics.inc('printed_patterns')
+
+    @classmethod
+    def _print_pattern_files(cls, root_dir, pattern):
         logger.warning(f'Printing pattern #{pattern.id}', show_pid=True)
 
         pattern_id_dir = os.path.join(root_dir, str(pattern.id))
@@ -210,21 +616,31 @@ class Miner:
         with open(os.path.join(pattern_id_dir, 'details.html'), 'w+') as f:
             f.write(details)
 
+        dot_paths = []
         printable_fragments = pattern.fragments if cls.FULL_PRINT else [pattern.repr]
         for fragment in printable_fragments:
             try:
-                cls._print_fragment(pattern, pattern_id_dir, fragment)
+                dot_paths.extend(cls._print_fragment(pattern, pattern_id_dir, fragment))
             except:
                 logger.error(f'Unable to print fragment {fragment.id} for pattern {pattern.id}, '
                              f'commit=#{fragment.graph.repo_info.commit_hash}, '
                              f'file={fragment.graph.repo_info.old_method.file_path}, '
                              f'method={fragment.graph.repo_info.old_method.full_name}', exc_info=True)
 
+        if cls.RENDER_GRAPHS and dot_paths:
+            try:
+                changegraph.render_dot_files(dot_paths)
+            except:
+                logger.error(f'Unable to render graphs for pattern {pattern.id}', exc_info=True)
+
     @classmethod
     def _print_fragment(cls, pattern, out_dir, fragment):
+        """Print the fragment files, the .dot ones are only saved and their paths returned for a batched render."""
         file_suffix = f'-{fragment.id}' if cls.FULL_PRINT else ''
-        changegraph.print_out_nodes(fragment.nodes, path=os.path.join(out_dir, f'fragment{file_suffix}.dot'))
-        changegraph.export_graph_image(fragment.graph, path=os.path.join(out_dir, f'graph{file_suffix}.dot'))
+        dot_paths = [os.path.join(out_dir, f'fragment{file_suffix}.dot'),
+                     os.path.join(out_dir, f'graph{file_suffix}.dot')]
+        changegraph.print_out_nodes(fragment.nodes, path=dot_paths[0], render=False)
+        changegraph.export_graph_image(fragment.graph, path=dot_paths[1], render=False)
 
         sample = cls._generate_html_sample(f'{pattern.id}{file_suffix}', fragment)
         if sample:
@@ -232,7 +648,7 @@ class Miner:
                 f.write(sample)
 
             if not cls.OUTPUT_DETAILS:
-                return
+                return dot_paths
 
             repo_info = fragment.graph.repo_info
             with open(os.path.join(out_dir, f'sample-details{file_suffix}.json'), 'w+') as f:
@@ -272,6 +688,8 @@ class Miner:
                 }
                 json.dump(data, f, indent=4)
 
+        return dot_paths
+
     @classmethod
     def _generate_html_details(cls, pattern):
         instances = []
@@ -312,7 +730,7 @@ class Miner:
         repo_url = repo_info.repo_url.strip()[:-4]
         commit_hash = repo_info.commit_hash
 
-        line_number = repo_info.old_method.get_ast().sloc_range.start.line
+        line_number = repo_info.old_method.get_sloc_range().start_line
 
         optional_links = ''
         if cls.FULL_PRINT:
@@ -326,7 +744,7 @@ class Miner:
                  f'<div>Commit: <a target="_blank" href="{repo_url}/commit/{commit_hash}">#{commit_hash}</a></div>\n' \
                  f'<div>File: {repo_info.old_method.file_path} to {repo_info.new_method.file_path}</div>\n' \
                  f'<div>Func: {repo_info.old_method.full_name} to {repo_info.new_method.full_name}</div>\n' \
-                 f'<div>SLoc Range: {repo_info.old_method.get_ast().sloc_range} to {repo_info.new_method.get_ast().sloc_range}</div>' \
+                 f'<div>SLoc Range: {repo_info.old_method.get_sloc_range()} to {repo_info.new_method.get_sloc_range()}</div>' \
                  f'<div>Link: ' \
                  f'<a target="_blank" href="' \
                  f'{cls._get_base_line_url(repo_info, version=ChangeNode.Version.BEFORE_CHANGES)}{line_number}">' \
@@ -417,7 +835,7 @@ class Miner:
 
         return f'<pre class="code language-ada" ' \
                f'data-base-line-url="{cls._get_base_line_url(repo_info, version)}" ' \
-               f'data-line-number="{method.get_ast().sloc_range}" ' \
+               f'data-line-number="{method.get_sloc_range()}" ' \
                f'data-code-version="{version}">\n' \
                f'{cls._get_markup(fragment, src, version)}' \
                f'</pre>\n'
@@ -430,7 +848,7 @@ class Miner:
             for in_node in in_nodes:
                 defs = in_node.get_definitions()
                 for def_node in defs:
-                    if def_node in fragment.nodes:
+                    if fragment.has_node(def_node):
                         printable_nodes.add(in_node)
                         break
         printable_nodes = printable_nodes.union(fragment.nodes)
@@ -452,58 +870,25 @@ class Miner:
 
         pattern_intervals = cls.merge_intervals(pattern_intervals)
 
-        markup = src
-        offset = 0
+        # one walk over the source with the sorted disjoint intervals, escaped pieces are joined once at the end
+        pieces = []
         last_end = 0
-
         for start, end in pattern_intervals:
-            start += offset
-            end += offset
-
-            escaped_markup = markup[:last_end] + html.escape(markup[last_end:start]) + markup[start:]
-            offset_delta = len(escaped_markup) - len(markup)
-            markup = escaped_markup
-
-            start += offset_delta
-            end += offset_delta
-            offset += offset_delta
-
-            chunk, offset_delta = cls._get_highlighted_chunk(markup[start:end])
-            markup = markup[:start] + chunk + markup[end:]
-
-            offset += offset_delta
-            last_end = end + offset_delta
+            pieces.append(html.escape(src[last_end:start]))
+            pieces.append(cls._get_highlighted_chunk(src[start:end]))
+            last_end = end
+        pieces.append(html.escape(src[last_end:]))
 
-        markup = markup[:last_end] + html.escape(markup[last_end:])
+        return ''.join(pieces).strip()
 
-        return markup.strip()
+    HIGHLIGHT_BEFORE = '<span class="highlighted">'
+    HIGHLIGHT_AFTER = '</span>'
 
-    @staticmethod
-    def _get_highlighted_chunk(chunk_src):
-        # escape
-        chunk = html.escape(chunk_src)
-        offset = len(chunk) - len(chunk_src)
-
-        # mark changes
-        put_before = f'<span class="highlighted">'
-        put_after = f'</span>'
-        highlight_offset = (len(put_before) + len(put_after))
-
-        line_break_regex = re.compile('\n')
-        lb_repl_cnt = 0
-
-        def line_break_repl(_):
-            nonlocal lb_repl_cnt
-            lb_repl_cnt += 1
-            return f'{put_after}\n{put_before}'
-
-        chunk = re.sub(line_break_regex, line_break_repl, chunk)
-        offset += lb_repl_cnt * highlight_offset
-
-        chunk = put_before + chunk + put_after
-        offset += highlight_offset
-
-        return chunk, offset
+    @classmethod
+    def _get_highlighted_chunk(cls, chunk_src):
+        # every line of the chunk is marked separately
+        chunk = html.escape(chunk_src).replace('\n', f'{cls.HIGHLIGHT_AFTER}\n{cls.HIGHLIGHT_BEFORE}')
+        return cls.HIGHLIGHT_BEFORE + chunk + cls.HIGHLIGHT_AFTER
 
     @staticmethod
     def merge_intervals(intervals):
@@ -527,3 +912,59 @@ class Miner:
                 last_interval = intervals[i]
 
         return new_intervals
+
+
+_seed_graphs = {}
+SEED_GRAPH_CACHE_SIZE = 512
+
+
+def _init_seed_worker(log_queue):
+    # seeds are already spread over the pool, and its daemonic workers cannot start pools of their own
+    Pattern.DO_ASYNC_MINING = False
+    logger.attach_queue(log_queue)
+
+
+_report_graphs = {}
+REPORT_GRAPH_CACHE_SIZE = 512
+
+
+def _print_pattern_record(task):
+    same_size_dir, record = task
+    if len(_report_graphs) > REPORT_GRAPH_CACHE_SIZE:
+        _report_graphs.clear()
+
+    pattern = PatternStore.from_record(record, _report_graphs)
+    Miner._print_pattern(same_size_dir, pattern)
+    metrics.flush()
+    return pattern.id
+
+
+def _init_partition_worker(log_queue):
+    # every unit is a process of the pool already
+    Pattern.DO_ASYNC_MINING = False
+    Miner.DO_ASYNC_SEEDS = False
+    logger.attach_queue(log_queue)
+
+
+def _mine_partition(partition):
+    patterns_cnt = Miner().mine_partition(partition)
+    metrics.flush()
+    return partition, patterns_cnt
+
+
+def _extend_seed_ref(task):
+    num, pair_refs = task
+    logger.warning(f'Looking at node pair #{num + 1}', show_pid=True)
+    if len(_seed_graphs) > SEED_GRAPH_CACHE_SIZE:
+        _seed_graphs.clear()
+
+    pairs = []
+    for path, before_index, after_index in pair_refs:
+        graph = _seed_graphs.get(path)
+        if graph is None:
+            graph = _seed_graphs[path] = storage.load_graph(path)
+        pairs.append((graph.node_list[before_index], graph.node_list[after_index]))
+
+    pattern = Miner.extend_seed(pairs)
+    metrics.flush()
+    return num, pattern.to_ref() if pattern else None
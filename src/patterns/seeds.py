@@ -0,0 +1,100 @@
+import os
+import pickle
+import shutil
+import zlib
+
+from typing import Dict, Iterator, List, Tuple
+
+from log import logger
+
+
+SeedRef = Tuple[str, int, int]  # graph path, index of the node before changes, index of its mapped node
+
+
+class SeedIndex:
+    """
+    Seed pairs grouped by label, kept as SeedRef tuples so that no graph has to stay loaded.
+
+    Without a spill dir all the labels form a single partition held in memory. With one, every label belongs to
+    a partition picked by a stable hash of the label, refs are buffered and appended to the partition's file,
+    and the partitions are read back one at a time.
+    """
+
+    BUFFER_SIZE = 100000
+
+    def __init__(self, spill_dir=None, partitions=1, reset=True):
+        self.spill_dir = spill_dir
+        self.partitions = partitions if spill_dir else 1
+
+        self._buffers: List[Dict[str, List[SeedRef]]] = [{} for _ in range(self.partitions)]
+        self._buffered = 0
+
+        if spill_dir and reset:
+            if os.path.exists(spill_dir):
+                shutil.rmtree(spill_dir)
+            os.makedirs(spill_dir)
+
+    @staticmethod
+    def get_partition(label, partitions):
+        return zlib.crc32(label.encode()) % partitions
+
+    def add(self, label, ref: SeedRef):
+        buffer = self._buffers[self.get_partition(label, self.partitions)]
+        buffer.setdefault(label, []).append(ref)
+
+        self._buffered += 1
+        if self.spill_dir and self._buffered >= self.BUFFER_SIZE:
+            self.flush()
+
+    def flush(self):
+        if not self.spill_dir:
+            return
+
+        for partition, buffer in enumerate(self._buffers):
+            if buffer:
+                with open(self._get_partition_path(partition), 'ab') as f:
+                    pickle.dump(buffer, f, protocol=5)
+                buffer.clear()
+        self._buffered = 0
+
+    def iter_partitions(self) -> Iterator[Dict[str, List[SeedRef]]]:
+        """Label to seed refs, one partition at a time, labels in the order they were first added."""
+        if not self.spill_dir:
+            yield self._buffers[0]
+            return
+
+        self.flush()
+        for partition in range(self.partitions):
+            yield self.read_partition(partition)
+
+    def read_partition(self, partition) -> Dict[str, List[SeedRef]]:
+        """Label to seed refs of a spilled partition, which any process seeing the spill dir can read."""
+        label_to_refs = {}
+        path = self._get_partition_path(partition)
+        if not os.path.exists(path):
+            return label_to_refs
+
+        with open(path, 'rb') as f:
+            while True:
+                try:
+                    chunk = pickle.load(f)
+                except EOFError:
+                    break
+
+                for label, refs in chunk.items():
+                    label_to_refs.setdefault(label, []).extend(refs)
+
+        logger.warning(f'Loaded seed partition [{1 + partition}/{self.partitions}] '
+                       f'with {len(label_to_refs)} labels')
+        return label_to_refs
+
+    def clear(self):
+        for buffer in self._buffers:
+            buffer.clear()
+        self._buffered = 0
+
+        if self.spill_dir and os.path.exists(self.spill_dir):
+            shutil.rmtree(self.spill_dir)
+
+    def _get_partition_path(self, partition):
+        return os.path.join(self.spill_dir, f'seeds-{partition}.pickle')
@@ -0,0 +1,75 @@
+import os
+import pickle
+
+from typing import Dict, Iterator
+
+from log import logger
+from changegraph import storage
+from patterns.models import Pattern
+
+
+class PatternStore:
+    """
+    Append-only file of pattern records built on Pattern.to_ref(): ids, frequencies, graph paths and node indexes,
+    no graphs. A store written by one process can be read by any other one seeing the same file system,
+    and a store cut by a crash keeps every record written before.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def create(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        open(self.path, 'wb').close()
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def append(self, patterns):
+        with open(self.path, 'ab') as f:
+            for pattern in patterns:
+                pickle.dump(self.to_record(pattern), f, protocol=5)
+
+    @staticmethod
+    def to_record(pattern):
+        return pattern.id, pattern.to_ref(), pattern.repr in pattern.fragments
+
+    @staticmethod
+    def from_record(record, path_to_graph: Dict[str, object]) -> Pattern:
+        """Rebuild a pattern, loading the graphs missing in path_to_graph and adding them there."""
+        pattern_id, ref, has_repr = record
+        for path, _ in ref[1]:
+            if path not in path_to_graph:
+                path_to_graph[path] = storage.load_graph(path)
+
+        pattern = Pattern.create_from_ref(ref, path_to_graph)
+        pattern.id = pattern_id
+        if not has_repr:
+            pattern.fragments.remove(pattern.repr)
+        return pattern
+
+    def iter_records(self) -> Iterator[tuple]:
+        """(pattern id, Pattern.to_ref(), whether the representative is among the fragments) records."""
+        with open(self.path, 'rb') as f:
+            while True:
+                try:
+                    yield pickle.load(f)
+                except EOFError:
+                    break
+                except pickle.UnpicklingError:
+                    logger.warning(f'Pattern store {self.path} ends with a broken record, it was skipped')
+                    break
+
+    @staticmethod
+    def get_size(record):
+        _, (_, fragment_refs), _ = record
+        return len(fragment_refs[0][1])
+
+    def iter_records_of_size(self, size) -> Iterator[tuple]:
+        return (record for record in self.iter_records() if self.get_size(record) == size)
+
+    def iter_patterns(self, path_to_graph: Dict[str, object], size=None) -> Iterator[Pattern]:
+        """Rebuild the stored patterns, only the ones of the given size if it is set."""
+        records = self.iter_records() if size is None else self.iter_records_of_size(size)
+        for record in records:
+            yield self.from_record(record, path_to_graph)
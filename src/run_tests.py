@@ -2,6 +2,16 @@ import tests
 
 def run_tests():
     tests.test_tree_mapping()
+    tests.test_if_expression_graph()
+    tests.test_deep_closure()
+    tests.test_edge_set_buckets()
+    tests.test_fragment_bitsets()
+    tests.test_create_groups()
+    tests.test_get_graph_overlapped_fragments()
+    tests.test_filter_patterns()
+    tests.test_export()
+    tests.test_metrics_spools()
+    tests.test_progress_done()
 
 if __name__ == '__main__':
     run_tests()
\ No newline at end of file
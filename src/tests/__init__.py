@@ -1,4 +1,14 @@
-from . import test_change_graphs, test_tree_mapping
+from . import test_change_graphs, test_flow_graphs, test_log, test_patterns, test_tree_mapping
 
 test_change_graphs = test_change_graphs.test_change_graphs
+test_if_expression_graph = test_flow_graphs.test_if_expression_graph
+test_deep_closure = test_flow_graphs.test_deep_closure
+test_edge_set_buckets = test_flow_graphs.test_edge_set_buckets
+test_fragment_bitsets = test_patterns.test_fragment_bitsets
+test_create_groups = test_patterns.test_create_groups
+test_get_graph_overlapped_fragments = test_patterns.test_get_graph_overlapped_fragments
+test_filter_patterns = test_patterns.test_filter_patterns
+test_export = test_patterns.test_export
+test_metrics_spools = test_log.test_metrics_spools
+test_progress_done = test_log.test_progress_done
 test_tree_mapping = test_tree_mapping.test_tree_mapping
\ No newline at end of file
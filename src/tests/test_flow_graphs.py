@@ -0,0 +1,135 @@
+import random
+import sys
+import types
+
+import adaflowgraph
+from adaflowgraph.build import GraphBuilder
+from adaflowgraph.models import ExtControlFlowGraph, DataNode, OperationNode, LinkType, Edge, EdgeSet
+
+
+IF_EXPRESSION_SOURCE = '''
+function Test_0 (A : Integer; B : Integer) return Integer is
+    C : Integer := (if A > B then A - B elsif A = B then 0 else B - A);
+begin
+    return (if C > 10 then C else (if C > 0 then 1 else 0));
+end Test_0;
+'''
+
+# a chain of this many assignments to the same variable is deeper than the default recursion limit
+CLOSURE_CHAIN_LENGTH = 2000
+
+
+def _copying_absorb(target, source, keep_source=False):
+    target |= source
+    return target
+
+
+def _describe(fg):
+    nodes = sorted(fg.nodes, key=lambda n: n.statement_num)
+    index = {node: i for i, node in enumerate(nodes)}
+    edges = sorted((index.get(e.node_from, -1), index.get(e.node_to, -1), str(e.label))
+                   for node in nodes for e in node.in_edges | node.out_edges)
+    return [(type(node).__name__, node.label) for node in nodes], edges
+
+
+def test_if_expression_graph():
+    """The graph built with sets taken over on merge is the one built by copying them."""
+    fg = adaflowgraph.build_from_source('test_0.adb', IF_EXPRESSION_SOURCE)
+
+    absorb = ExtControlFlowGraph._absorb
+    ExtControlFlowGraph._absorb = staticmethod(_copying_absorb)
+    try:
+        expected_fg = adaflowgraph.build_from_source('test_0.adb', IF_EXPRESSION_SOURCE)
+    finally:
+        ExtControlFlowGraph._absorb = absorb
+
+    assert _describe(fg) == _describe(expected_fg)
+
+
+def _create_assignment_chain(length):
+    """Nodes of a = a + ...; repeated length times, every assignment depends on the previous one."""
+    nodes = [DataNode('a', None, key='a')]
+    for _ in range(length):
+        op_node = OperationNode('+', None, [])
+        nodes[-1].create_edge(op_node, LinkType.PARAMETER)
+        var_node = DataNode('a', None, key='a')
+        op_node.create_edge(var_node, LinkType.DEFINITION)
+        nodes += [op_node, var_node]
+    return types.SimpleNamespace(nodes=set(nodes))
+
+
+def _recursive_run_processor(processor_fn, node, processed_nodes):
+    for dependency in processor_fn(node, processed_nodes):
+        _recursive_run_processor(processor_fn, dependency, processed_nodes)
+
+
+def test_deep_closure():
+    """Closures of a dependency chain deeper than the recursion limit are the ones plain recursion builds."""
+    fg = _create_assignment_chain(CLOSURE_CHAIN_LENGTH)
+    GraphBuilder.build_closure(fg)
+
+    expected_fg = _create_assignment_chain(CLOSURE_CHAIN_LENGTH)
+    run_processor = GraphBuilder._run_processor
+    recursion_limit = sys.getrecursionlimit()
+    GraphBuilder._run_processor = classmethod(
+        lambda cls, processor_fn, node, processed_nodes: _recursive_run_processor(processor_fn, node, processed_nodes))
+    sys.setrecursionlimit(10 * CLOSURE_CHAIN_LENGTH)
+    try:
+        GraphBuilder.build_closure(expected_fg)
+    finally:
+        GraphBuilder._run_processor = run_processor
+        sys.setrecursionlimit(recursion_limit)
+
+    assert _describe(fg) == _describe(expected_fg)
+
+
+EDGE_SET_LABELS = [LinkType.DEFINITION, LinkType.PARAMETER, LinkType.REFERENCE, 'control']
+EDGE_SET_OPERATIONS = [
+    lambda edge_set, edges: edge_set.add(edges[0]),
+    lambda edge_set, edges: edge_set.discard(edges[0]),
+    lambda edge_set, edges: edge_set.remove(edges[0]) if edges[0] in edge_set else None,
+    lambda edge_set, edges: edge_set.pop() if edge_set else None,
+    lambda edge_set, edges: edge_set.update(edges),
+    lambda edge_set, edges: edge_set.difference_update(edges),
+    lambda edge_set, edges: edge_set.intersection_update(edges),
+    lambda edge_set, edges: edge_set.symmetric_difference_update(edges),
+    lambda edge_set, edges: edge_set.__ior__(set(edges)),
+    lambda edge_set, edges: edge_set.__isub__(set(edges)),
+    lambda edge_set, edges: edge_set.__iand__(set(edges)),
+    lambda edge_set, edges: edge_set.__ixor__(set(edges)),
+    lambda edge_set, edges: edge_set.clear(),
+]
+
+
+def _assert_buckets(edge_set, label_to_view):
+    for label, view in label_to_view.items():
+        expected = {e for e in edge_set if e.label == label}
+        assert set(edge_set.with_label(label)) == expected
+        assert set(view) == expected and len(view) == len(expected)
+        assert all(e in view for e in expected)
+
+    excluded = EDGE_SET_LABELS[:2]
+    assert set(edge_set.without_labels(excluded)) == {e for e in edge_set if e.label not in excluded}
+
+
+def test_edge_set_buckets():
+    """Label buckets follow every way of changing an edge set, and the views on them are read-only."""
+    edges = [Edge(label, None, None) for label in EDGE_SET_LABELS for _ in range(4)]
+    view = EdgeSet(edges).with_label(LinkType.DEFINITION)
+    assert not hasattr(view, 'add') and not hasattr(view, 'discard')
+
+    for seed in range(100):
+        rnd = random.Random(seed)
+        edge_set = EdgeSet(rnd.sample(edges, rnd.randint(0, len(edges))))
+        label_to_view = {label: edge_set.with_label(label) for label in EDGE_SET_LABELS}
+
+        for _ in range(30):
+            operation = rnd.choice(EDGE_SET_OPERATIONS)
+            operation(edge_set, rnd.sample(edges, rnd.randint(1, 6)))
+            _assert_buckets(edge_set, label_to_view)
+
+
+if __name__ == '__main__':
+    test_if_expression_graph()
+    test_deep_closure()
+    test_edge_set_buckets()
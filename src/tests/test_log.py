@@ -0,0 +1,53 @@
+import logging
+import multiprocessing
+
+from log import logger, metrics
+
+
+def _spool_task(num):
+    metrics.inc('test_spool_tasks')
+    metrics.flush()
+    return num
+
+
+def test_metrics_spools():
+    """Every pool worker flushes its own spool and the root process adds them all up."""
+    assert not metrics.is_worker
+
+    # one task per worker process, so more workers write spools than the pool has at once
+    with multiprocessing.Pool(processes=2, maxtasksperchild=1) as pool:
+        assert sorted(pool.imap_unordered(_spool_task, range(6), chunksize=1)) == list(range(6))
+
+    counters, _ = metrics.collect()
+    assert counters[('test_spool_tasks', ())] == 6
+
+
+class _ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__(logging.WARNING)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage().strip())
+
+
+def test_progress_done():
+    """The count reached between two reports is logged by progress_done(), once."""
+    handler = _ListHandler()
+    logging.getLogger().addHandler(handler)
+    logger.PROGRESS_INTERVAL = 3600
+    try:
+        for count in range(1, 6):
+            logger.progress('test items', count)
+        logger.progress_done('test items')
+        logger.progress_done('test items')
+    finally:
+        del logger.PROGRESS_INTERVAL
+        logging.getLogger().removeHandler(handler)
+
+    assert handler.messages == ['test items: 1', 'test items: 5 done']
+
+
+if __name__ == '__main__':
+    test_metrics_spools()
+    test_progress_done()
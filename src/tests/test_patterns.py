@@ -0,0 +1,285 @@
+import copy
+import datetime
+import json
+import os
+import random
+import tempfile
+import types
+
+import vb_utils
+from adaflowgraph.models import LinkType
+from changegraph.models import ChangeNode, ChangeGraph, ChangeEdge
+from patterns.models import Fragment, Pattern
+from patterns.export import NdjsonExporter
+from patterns.search import Miner
+from vcs.traverse import RepoInfo
+
+
+SEEDS = range(200)
+LINK_TYPES = [LinkType.DEFINITION, LinkType.PARAMETER, LinkType.RECEIVER, LinkType.REFERENCE]
+
+
+class _StubAst:
+    text = 'x'
+
+
+def _create_graph(rnd, size=10):
+    graph = ChangeGraph()
+    for num in range(size):
+        sub_kind = ChangeNode.SubKind.OP_FUNC_CALL if rnd.random() < 0.4 else None
+        graph.add_node(ChangeNode(num, _StubAst(), rnd.choice('ab'), ChangeNode.Kind.OPERATION_NODE, num % 2,
+                                  sub_kind=sub_kind))
+
+    for _ in range(size):
+        node_from, node_to = rnd.sample(graph.node_list, 2)
+        ChangeEdge.create(rnd.choice(LINK_TYPES), node_from, node_to)
+    return graph
+
+
+def _create_chain_graph(labels, call_nodes=()):
+    """Graph of nodes with the given labels, each one the parameter of the next, call_nodes are function calls."""
+    graph = ChangeGraph()
+    for num, label in enumerate(labels):
+        sub_kind = ChangeNode.SubKind.OP_FUNC_CALL if num in call_nodes else None
+        graph.add_node(ChangeNode(num, _StubAst(), label, ChangeNode.Kind.OPERATION_NODE, num % 2, sub_kind=sub_kind))
+
+    for node_from, node_to in zip(graph.node_list, graph.node_list[1:]):
+        ChangeEdge.create(LinkType.PARAMETER, node_from, node_to)
+    return graph
+
+
+def _create_fragment_of(graph, indexes):
+    fragment = Fragment.create_from_node(graph.node_list[indexes[0]])
+    if len(indexes) > 1:
+        fragment = Fragment.create_extended(fragment, tuple(graph.node_list[index] for index in indexes[1:]))
+    return fragment
+
+
+def _create_fragment(rnd, graph, size):
+    return _create_fragment_of(graph, [node.index for node in rnd.sample(graph.node_list, size)])
+
+
+def _create_fragments(rnd, graphs, count, size):
+    return [_create_fragment(rnd, rnd.choice(graphs), size) for _ in range(count)]
+
+
+# the set based logic the bitsets and indexes replaced
+
+def _baseline_overlap(fragment1, fragment2):
+    return any(node.sub_kind == ChangeNode.SubKind.OP_FUNC_CALL
+               for node in set(fragment1.nodes).intersection(fragment2.nodes))
+
+
+def _baseline_is_equal(fragment1, fragment2):
+    return set(fragment1.nodes) == set(fragment2.nodes)
+
+
+def _baseline_contains(fragment1, fragment2):
+    if fragment1.size < fragment2.size or fragment1.graph.nodes != fragment2.graph.nodes:
+        return False
+    return set(fragment2.nodes).issubset(fragment1.nodes)
+
+
+def _baseline_create_groups(fragments):
+    groups = set()
+    fragments = set(fragments)
+    while fragments:
+        fragment = fragments.pop()
+        group = [fragment] + [fr for fr in fragments if fr.vector.data == fragment.vector.data]
+        fragments.difference_update(group)
+
+        vb_utils.filter_list(group, condition=lambda i, j: _baseline_is_equal(group[i], group[j]))
+        if len(group) >= Pattern.MIN_FREQUENCY:
+            groups.add(frozenset(group))
+    return groups
+
+
+def _baseline_get_graph_overlapped_fragments(ext_fragments):
+    graph_to_fragments = {}
+    for fragment in ext_fragments:
+        graph_to_fragments.setdefault(fragment.graph, []).append(fragment)
+
+    overlapped_fragments = []
+    for fragments in graph_to_fragments.values():
+        vb_utils.filter_list(
+            fragments,
+            condition=lambda i, j: _baseline_overlap(fragments[i], fragments[j]),
+            post_condition_fn=lambda i, j: overlapped_fragments.append(fragments[j])
+        )
+    return overlapped_fragments
+
+
+def _baseline_pattern_contains(pattern1, pattern2):
+    if pattern1.size < pattern2.size:
+        return False
+    return any(pattern1.size >= fragment2.size and _baseline_contains(fragment1, fragment2)
+               for fragment2 in pattern2.fragments for fragment1 in pattern1.fragments)
+
+
+def _baseline_filter_patterns(size_to_patterns):
+    size_to_patterns = {size: set(patterns) for size, patterns in size_to_patterns.items()}
+    keys = sorted(size_to_patterns.keys())
+    for size1 in keys:
+        patterns = size_to_patterns[size1]
+        for pattern1 in copy.copy(patterns):
+            if any(pattern2 != pattern1 and _baseline_pattern_contains(pattern2, pattern1)
+                   for size2 in keys if size2 >= size1 for pattern2 in size_to_patterns[size2]):
+                patterns.remove(pattern1)
+    return {size: patterns for size, patterns in size_to_patterns.items() if patterns}
+
+
+def _node_sets(groups):
+    return {frozenset((fragment.graph.id, frozenset(fragment.nodes)) for fragment in group) for group in groups}
+
+
+def test_fragment_bitsets():
+    graph = _create_chain_graph('abcd', call_nodes=[1])
+    other_graph = _create_chain_graph('abcd', call_nodes=[1])
+    fragment01 = _create_fragment_of(graph, [0, 1])
+    fragment10 = _create_fragment_of(graph, [1, 0])
+    fragment12 = _create_fragment_of(graph, [1, 2])
+    fragment23 = _create_fragment_of(graph, [2, 3])
+    fragment012 = _create_fragment_of(graph, [0, 1, 2])
+
+    assert fragment01.node_bits == fragment10.node_bits == 0b11
+    assert fragment012.has_node(graph.node_list[2]) and not fragment012.has_node(graph.node_list[3])
+    assert fragment01.is_equal(fragment10) and not fragment01.is_equal(_create_fragment_of(other_graph, [0, 1]))
+    assert fragment01.overlap(fragment12)  # both have the call node 1
+    assert not fragment12.overlap(fragment23)  # they only share node 2, which is not a call
+    assert fragment012.contains(fragment12) and not fragment12.contains(fragment012)
+    assert not fragment012.contains(fragment23)
+
+    for seed in SEEDS:
+        rnd = random.Random(seed)
+        graphs = [_create_graph(rnd) for _ in range(2)]
+        fragments = _create_fragments(rnd, graphs, 8, rnd.randint(1, 5))
+        fragments += _create_fragments(rnd, graphs, 8, rnd.randint(1, 5))
+
+        for fragment in fragments:
+            assert fragment.node_bits == sum(1 << node.index for node in set(fragment.nodes))
+            for node in fragment.graph.node_list:
+                assert fragment.has_node(node) == (node in fragment.nodes)
+
+        for fragment1 in fragments:
+            for fragment2 in fragments:
+                assert fragment1.overlap(fragment2) == _baseline_overlap(fragment1, fragment2)
+                assert fragment1.contains(fragment2) == _baseline_contains(fragment1, fragment2)
+                assert fragment1.is_equal(fragment2) == (fragment1.graph is fragment2.graph
+                                                         and _baseline_is_equal(fragment1, fragment2))
+
+
+def test_create_groups():
+    graphs = [_create_chain_graph('abc') for _ in range(Pattern.MIN_FREQUENCY)]
+    ab_fragments = [_create_fragment_of(graph, [0, 1]) for graph in graphs]
+    duplicate = _create_fragment_of(graphs[0], [1, 0])  # the nodes of ab_fragments[0] added the other way round
+    bc_fragments = [_create_fragment_of(graph, [1, 2]) for graph in graphs[1:]]  # one fragment short of a group
+
+    groups = Fragment.create_groups(set(ab_fragments + bc_fragments + [duplicate]))
+    assert _node_sets(groups) == _node_sets([ab_fragments])
+
+    for seed in SEEDS:
+        rnd = random.Random(seed)
+        graphs = [_create_graph(rnd, size=6) for _ in range(3)]
+        fragments = set(_create_fragments(rnd, graphs, rnd.randint(1, 30), rnd.randint(1, 3)))
+
+        assert _node_sets(Fragment.create_groups(fragments)) == _node_sets(_baseline_create_groups(fragments))
+
+
+def test_get_graph_overlapped_fragments():
+    graph = _create_chain_graph('abcd', call_nodes=[1])
+    other_graph = _create_chain_graph('abcd', call_nodes=[1])
+    fragment01 = _create_fragment_of(graph, [0, 1])
+    fragment12 = _create_fragment_of(graph, [1, 2])
+    fragment23 = _create_fragment_of(graph, [2, 3])  # shares node 2 with fragment12, which is not a call
+    other_fragment01 = _create_fragment_of(other_graph, [0, 1])  # same call node index, but another graph
+
+    overlapped = Pattern.get_graph_overlapped_fragments(
+        frozenset([fragment01, fragment12, fragment23, other_fragment01]))
+    assert len(overlapped) == 1 and overlapped[0] in (fragment01, fragment12)
+
+    for seed in SEEDS:
+        rnd = random.Random(seed)
+        graphs = [_create_graph(rnd) for _ in range(3)]
+        fragments = frozenset(_create_fragments(rnd, graphs, rnd.randint(1, 20), rnd.randint(1, 4)))
+
+        assert Pattern.get_graph_overlapped_fragments(fragments) == \
+            _baseline_get_graph_overlapped_fragments(fragments)
+
+
+def _create_pattern(graphs, indexes):
+    fragments = {_create_fragment_of(graph, indexes) for graph in graphs}
+    return Pattern(fragments, len(fragments))
+
+
+def test_filter_patterns():
+    graphs = [_create_chain_graph('abcd') for _ in range(3)]
+    subsumed = _create_pattern(graphs, [0, 1])
+    containing = _create_pattern(graphs, [0, 1, 2])
+    apart = _create_pattern(graphs, [2, 3])  # its node 3 is in no other pattern
+
+    miner = Miner()
+    for pattern in [subsumed, containing, apart]:
+        miner.add_pattern(pattern)
+    miner._filter_patterns()
+    assert miner._size_to_patterns == {2: {apart}, 3: {containing}}
+    assert miner._patterns_cnt == 2
+
+    for seed in SEEDS:
+        rnd = random.Random(seed)
+        graphs = [_create_graph(rnd, size=8) for _ in range(3)]
+
+        miner = Miner()
+        for _ in range(rnd.randint(1, 25)):
+            fragments = set(_create_fragments(rnd, graphs, rnd.randint(1, 3), rnd.randint(1, 5)))
+            miner.add_pattern(Pattern(fragments, len(fragments)))
+
+        expected = _baseline_filter_patterns(miner._size_to_patterns)
+        miner._filter_patterns()
+        assert miner._size_to_patterns == expected
+        assert miner._patterns_cnt == sum(len(patterns) for patterns in expected.values())
+
+
+def _read_records(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_export():
+    graphs = [_create_chain_graph('abcd') for _ in range(3)]
+    for num, graph in enumerate(graphs):
+        method = types.SimpleNamespace(full_name=f'Pkg.Method_{num}', sloc_range=None, byte_span=(0, 10))
+        graph.repo_info = RepoInfo('repo', '/repo', 'https://example.com/repo', f'{num:040x}',
+                                   datetime.datetime(2020, 1, num + 1, tzinfo=datetime.timezone.utc),
+                                   'old.adb', 'new.adb', method, method)
+    patterns = [_create_pattern(graphs, [0, 1]), _create_pattern(graphs, [0, 1, 2])]  # the first one is subsumed
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        miner = Miner()
+        miner.EXPORT_PATH = os.path.join(tmp_dir, 'patterns.ndjson')
+        miner.HIDE_OVERLAPPED_FRAGMENTS = False
+        miner._open_outputs()
+        for pattern in patterns:
+            miner.add_pattern(pattern)
+        mined_records = _read_records(miner.EXPORT_PATH)  # written as the patterns are added
+        miner._complete_mining()
+
+        assert mined_records == [json.loads(json.dumps(NdjsonExporter.to_json(pattern))) for pattern in patterns]
+        assert _read_records(miner.EXPORT_PATH) == mined_records
+        assert _read_records(os.path.join(tmp_dir, 'patterns.filtered.ndjson')) == mined_records[1:]
+
+    record = mined_records[1]
+    assert (record['id'], record['size'], record['freq']) == (patterns[1].id, 3, 3)
+    assert [node['label'] for node in record['nodes']] == ['a', 'b', 'c']
+    assert sorted((e['from'], e['to'], e['label']) for e in record['edges']) == \
+        [(0, 1, LinkType.PARAMETER), (1, 2, LinkType.PARAMETER)]
+    assert sorted(instance['commit']['hash'] for instance in record['instances']) == \
+        [f'{num:040x}' for num in range(3)]
+    assert sum(instance['repr'] for instance in record['instances']) == 1
+
+
+if __name__ == '__main__':
+    test_fragment_bitsets()
+    test_create_groups()
+    test_get_graph_overlapped_fragments()
+    test_filter_patterns()
+    test_export()
@@ -6,12 +6,14 @@ from typing import Optional, cast
 
 import libadalang as lal
 
-from libadalang import AdaNode, Identifier, Expr, _kind_to_astnode_cls, BinOp, SubpBody, Stmt, BlockStmt, ReturnStmt, \
+from libadalang import AdaNode, Identifier, Expr, BinOp, SubpBody, Stmt, BlockStmt, ReturnStmt, \
     ExitStmt, ForLoopStmt, WhileLoopStmt, ObjectDecl, DefiningNameList, DefiningName
 from multimethod import multimethod
 from overrides import overrides
 
+from utils.ada_ast_util import kind_of
 from utils.ada_node_matcher import match
+from utils.ada_node_table import AdaNodeTable, snapshot, node_text, node_parent, node_start
 from utils.ada_node_visitor import AdaNodeVisitor, accept
 from utils.pair import Pair
 from utils.string_processor import compute_char_lcs, serialize_to_chars
@@ -33,6 +35,7 @@ class TreedConstants:
 
 class TreedBuilder(AdaNodeVisitor):
     __root: AdaNode
+    __table: AdaNodeTable
     __visit_doc_tags: bool
     tree: dict[AdaNode, list[AdaNode]]
     tree_height: dict[AdaNode, int]
@@ -47,6 +50,7 @@ class TreedBuilder(AdaNodeVisitor):
         self.tree_vector = dict()
         self.tree_root_vector = dict()
         self.__root = root
+        self.__table = snapshot(root)
         self.__visit_doc_tags = visit_doc_tags
         self.tree_depth[root] = 0
 
@@ -54,7 +58,7 @@ class TreedBuilder(AdaNodeVisitor):
     def pre_visit(self, node: AdaNode):
         self.tree[node] = []
         if node != self.__root:
-            self.tree_depth[node] = self.tree_depth[node.parent] + 1
+            self.tree_depth[node] = self.tree_depth[self.__table.parent(node)] + 1
 
     @overrides
     def post_visit(self, node: AdaNode):
@@ -64,7 +68,7 @@ class TreedBuilder(AdaNodeVisitor):
 
     def build_tree(self, node: AdaNode):
         if node != self.__root:
-            parent: AdaNode = node.parent
+            parent: AdaNode = self.__table.parent(node)
             children: list[AdaNode] = self.tree.get(parent)
             children.append(node)
 
@@ -182,8 +186,10 @@ class TreedMapper:
         self.__number_of_non_name_unmaps = 0
         self.__ast_m = ast_m
         self.__ast_n = ast_n
-        self.__lines_m = source_m.splitlines()
-        self.__lines_n = source_n.splitlines()
+        snapshot(ast_m)
+        snapshot(ast_n)
+        self.__line_offsets_m = self.__line_offsets(source_m.splitlines())
+        self.__line_offsets_n = self.__line_offsets(source_n.splitlines())
         self.property_map = {}
         self.property_status = {}
 
@@ -326,8 +332,8 @@ class TreedMapper:
                 self.property_status[self.__ast_m] = TreedConstants.STATUS_UNCHANGED
                 self.property_status[self.__ast_n] = TreedConstants.STATUS_UNCHANGED
             else:
-                p: AdaNode = node.parent
-                mp: AdaNode = mapped_node.parent
+                p: AdaNode = node_parent(node)
+                mp: AdaNode = node_parent(mapped_node)
                 if mp not in self.__tree_map.get(p):
                     self.property_status[node] = TreedConstants.STATUS_MOVED
                     self.property_status[mapped_node] = TreedConstants.STATUS_MOVED
@@ -388,8 +394,8 @@ class TreedMapper:
 
     def __update_name_map(self, node_m: AdaNode, node_n: AdaNode):
         if isinstance(node_m, Identifier):
-            name_m: str = node_m.text
-            name_n: str = node_n.text
+            name_m: str = node_text(node_m)
+            name_n: str = node_text(node_n)
             map_frequency: dict[str, int] = self.__name_map_frequency.get(name_m, None)
             i_map_frequency: dict[str, int] = self.__name_map_frequency.get(name_n, None)
             if map_frequency is None:
@@ -406,9 +412,11 @@ class TreedMapper:
             self.__name_frequency[name_m] = c + 1
 
     def __check_name_map(self, node_m: AdaNode, node_n: AdaNode):
-        if node_m.text == node_n.text:
+        text_m: str = node_text(node_m)
+        text_n: str = node_text(node_n)
+        if text_m == text_n:
             return True
-        return node_n.text == self.__rename_map.get(node_m.text, None)
+        return text_n == self.__rename_map.get(text_m, None)
 
     # not sure why this can not be a multimethod?
     def _map_pivots(self):
@@ -546,10 +554,12 @@ class TreedMapper:
         d = self.__tree_depth.get(node1) - self.__tree_depth.get(node2)
         if d != 0:
             return d
-        if node1.sloc_range.start.line == node2.sloc_range.start.line:
-            return node1.sloc_range.start.column - node2.sloc_range.start.column
+        line1, column1 = node_start(node1)
+        line2, column2 = node_start(node2)
+        if line1 == line2:
+            return column1 - column2
         else:
-            return node1.sloc_range.start.line - node2.sloc_range.start.line
+            return line1 - line2
 
     def __map_bottom_up(self):
         heights_m: list[AdaNode] = list(self.__pivots_m)
@@ -563,14 +573,21 @@ class TreedMapper:
             self.__map(ancestors_m, ancestors_n, TreedConstants.MIN_SIMILARITY)
 
     @staticmethod
-    def __start_position(node: AdaNode, lines) -> int:
-        start_position: int = 0
-        if node.sloc_range.start.line - 1 > len(lines):
+    def __line_offsets(lines: list[str]) -> list[int]:
+        offsets: list[int] = [0]
+        for line in lines:
+            offsets.append(offsets[-1] + len(line))
+        return offsets
+
+    @staticmethod
+    def __start_position(node: AdaNode, line_offsets: list[int]) -> int:
+        line, column = node_start(node)
+        if line - 1 > len(line_offsets) - 1:
             print("that's weird!")
-        for i in range(0, node.sloc_range.start.line - 1):
-            start_position += len(lines[i])
-        start_position += node.sloc_range.start.column
-        return start_position
+        return line_offsets[line - 1] + column
+
+    def __relative_position(self, node: AdaNode, line_offsets: list[int]) -> int:
+        return self.__start_position(node_parent(node), line_offsets) - self.__start_position(node, line_offsets)
 
     def __map(self, nodes_m: list[AdaNode], nodes_n: list[AdaNode], threshold: float) -> list[AdaNode]:
         pairs_of_ancestor: dict[AdaNode, set[Pair]] = dict()
@@ -581,8 +598,8 @@ class TreedMapper:
                 similarity: float = self._compute_similarity(node_m, node_n, threshold)
                 if similarity >= threshold:
                     pair: Pair = Pair(node_m, node_n, similarity,
-                                      - abs((self.__start_position(node_m.parent, self.__lines_m) - self.__start_position(node_m, self.__lines_m)) -
-                                            (self.__start_position(node_n.parent, self.__lines_n) - self.__start_position(node_n, self.__lines_n))))
+                                      - abs(self.__relative_position(node_m, self.__line_offsets_m) -
+                                            self.__relative_position(node_n, self.__line_offsets_n)))
                     pairs1.add(pair)
                     pairs2: set[Pair] = pairs_of_ancestor.get(node_n, set())
                     pairs2.add(pair)
@@ -621,8 +638,8 @@ class TreedMapper:
             if node_m.is_a(BinOp):
                 similarity = TreedConstants.MIN_SIMILARITY_MOVE
             else:
-                text_m: str = node_m.text
-                text_n: str = node_n.text
+                text_m: str = node_text(node_m)
+                text_n: str = node_text(node_n)
                 if len(text_m) > 1000 or len(text_n) > 1000:
                     if len(text_m) == 0 and len(text_n) == 0:
                         similarity = 1.0
@@ -698,7 +715,7 @@ class TreedMapper:
         return length
 
     def __get_not_yet_mapped_ancestors(self, node: AdaNode, ancestors: list[AdaNode]):
-        parent: AdaNode = node.parent
+        parent: AdaNode = node_parent(node)
         if len(self.__tree_map[parent]) == 0:
             ancestors.append(parent)
             self.__get_not_yet_mapped_ancestors(parent, ancestors)
@@ -931,12 +948,12 @@ class TreedUtils:
 
     @staticmethod
     def build_label_for_vector(node: AdaNode) -> int:
-        label: int = list(_kind_to_astnode_cls.keys())[list(_kind_to_astnode_cls.values()).index(node.__class__)]
+        label: int = kind_of(node)
         if node.is_a(Expr):
             if node.kind_name.endswith('Literal'):
-                return (label | (hash(node.text) << 7)) & 0x10ffff
+                return (label | (hash(node_text(node)) << 7)) & 0x10ffff
             if node.is_a(Identifier):
-                return (label | (hash(node.text) << 7)) & 0x10ffff
+                return (label | (hash(node_text(node)) << 7)) & 0x10ffff
         if not TreedUtils.build_label_for_vector_warned:
             logger.warning('build_label_for_vector not fully implemented.')
             TreedUtils.build_label_for_vector_warned = True
@@ -947,11 +964,11 @@ class TreedUtils:
         label: str = node.kind_name
         if node.is_a(Expr):
             if label.endswith('Literal'):
-                return '{}({})'.format(label, node.text)
+                return '{}({})'.format(label, node_text(node))
             if node.is_a(BinOp):
-                return '{}({})'.format(label, cast(BinOp, node).f_op.text)
+                return '{}({})'.format(label, node_text(cast(BinOp, node).f_op))
             if node.is_a(Identifier):
-                return '{}({})'.format(label, node.text)
+                return '{}({})'.format(label, node_text(node))
             if not TreedUtils.build_ast_label_warned:
                 logger.warning('build_ast_label not fully implemented.')
                 TreedUtils.build_ast_label_warned = True
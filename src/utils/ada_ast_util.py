@@ -4,6 +4,14 @@ from libadalang import AdaNode, _kind_to_astnode_cls, BinOp
 from multimethod import multimethod
 
 
+# class -> libadalang kind id, the reverse of _kind_to_astnode_cls, built once at import
+KIND_OF_CLASS: dict[type, int] = {cls: kind for kind, cls in _kind_to_astnode_cls.items()}
+
+
+def kind_of(node: AdaNode) -> int:
+    return KIND_OF_CLASS[node.__class__]
+
+
 @multimethod
 def is_literal(ast_node_type: int) -> bool:
     return _kind_to_astnode_cls[ast_node_type].__name__.endswith('Literal')
@@ -16,12 +24,12 @@ def is_literal(node: AdaNode) -> bool:
 
 @multimethod
 def node_type(node_class: Type[object]) -> int:
-    return list(_kind_to_astnode_cls.keys())[list(_kind_to_astnode_cls.values()).index(node_class)]
+    return KIND_OF_CLASS[node_class]
 
 
 @multimethod
 def node_type(node: AdaNode) -> int:
-    return node_type(node.__class__)
+    return KIND_OF_CLASS[node.__class__]
 
 
 def start_position(node: AdaNode) -> int:
@@ -3,6 +3,8 @@ from typing import Optional
 from libadalang import *
 from multimethod import multimethod
 
+from utils.ada_ast_util import KIND_OF_CLASS
+
 
 @multimethod
 def match(node1: Optional[AdaNode], node2: Optional[AdaNode]) -> bool:
@@ -10,7 +12,7 @@ def match(node1: Optional[AdaNode], node2: Optional[AdaNode]) -> bool:
         return True
     elif node1 is None or node2 is None:
         return False
-    elif node1.kind_name != node2.kind_name:
+    elif KIND_OF_CLASS[node1.__class__] != KIND_OF_CLASS[node2.__class__]:
         return False
     return match_specific(node1, node2)
 
@@ -0,0 +1,221 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from typing import Optional
+
+from libadalang import AdaNode
+
+from utils.ada_ast_util import KIND_OF_CLASS
+
+
+NODE_TABLE_CACHE_SIZE = 16
+
+
+class FlatTree:
+    """
+    Pre-order snapshot of the subtree rooted at a node.
+
+    nodes[i] is the i-th node in pre-order, parents[i] is the index of its parent (-1 for the root),
+    depths[i] its depth below the root and ends[i] the index right after its last descendant,
+    so the subtree of nodes[i] is nodes[i:ends[i]].
+    """
+
+    def __init__(self, root: AdaNode):
+        self.root = root
+        self.nodes: list[AdaNode] = []
+        self.parents: list[int] = []
+        self.depths: list[int] = []
+        self.ends: list[int] = []
+        self.index: dict[AdaNode, int] = {}
+        if root is not None:
+            self._build()
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def _build(self):
+        stack = [(self.root, -1, 0)]
+        while stack:
+            node, parent, depth = stack.pop()
+            self.index[node] = len(self.nodes)
+            self.nodes.append(node)
+            self.parents.append(parent)
+            self.depths.append(depth)
+
+            parent = len(self.nodes) - 1
+            for child in reversed(node.children):
+                if child is not None:
+                    stack.append((child, parent, depth + 1))
+
+        self.ends = [i + 1 for i in range(len(self.nodes))]
+        for i in reversed(range(1, len(self.nodes))):
+            parent = self.parents[i]
+            if self.ends[i] > self.ends[parent]:
+                self.ends[parent] = self.ends[i]
+
+    def subtree(self, node: AdaNode) -> FlatTree:
+        """Slice the snapshot of a descendant out of this one without touching the live AST."""
+        start = self.index[node]
+        end = self.ends[start]
+        depth = self.depths[start]
+
+        tree = FlatTree(None)
+        tree.root = node
+        tree.nodes = self.nodes[start:end]
+        tree.parents = [-1] + [p - start for p in self.parents[start + 1:end]]
+        tree.depths = [d - depth for d in self.depths[start:end]]
+        tree.ends = [e - start for e in self.ends[start:end]]
+        tree.index = {n: i for i, n in enumerate(tree.nodes)}
+        return tree
+
+    def parent(self, node: AdaNode):
+        parent = self.parents[self.index[node]]
+        return self.nodes[parent] if parent >= 0 else None
+
+    def children(self, node: AdaNode) -> list[AdaNode]:
+        i = self.index[node]
+        result = []
+        child = i + 1
+        while child < self.ends[i]:
+            result.append(self.nodes[child])
+            child = self.ends[child]
+        return result
+
+    def accept(self, visitors):
+        """Walk the snapshot once, dispatching every node to all the visitors in the given order."""
+        nodes = self.nodes
+        ends = self.ends
+        visitors = list(visitors)
+
+        open_nodes = []  # (end, node, entered visitors, descending visitors)
+        i = 0
+        while i < len(nodes):
+            while open_nodes and open_nodes[-1][0] <= i:
+                _, closed, entered, _ = open_nodes.pop()
+                for visitor in entered:
+                    visitor.post_visit(closed)
+
+            active = open_nodes[-1][3] if open_nodes else visitors
+            node = nodes[i]
+            descending = []
+            for visitor in active:
+                visitor.pre_visit(node)
+                if visitor.visit(node):
+                    descending.append(visitor)
+
+            open_nodes.append((ends[i], node, active, descending))
+            i = i + 1 if descending else ends[i]
+
+        while open_nodes:
+            _, closed, entered, _ = open_nodes.pop()
+            for visitor in entered:
+                visitor.post_visit(closed)
+
+
+class AdaNodeTable(FlatTree):
+    """
+    Snapshot of a whole analysis unit: the pre-order structure of FlatTree plus the node properties
+    the pipeline keeps asking libadalang for. Every property is read through the FFI at most once;
+    slocs are taken eagerly, texts on first use since most inner nodes never need theirs.
+    """
+
+    def __init__(self, root: AdaNode):
+        super().__init__(root)
+
+        self.kinds: list[int] = [KIND_OF_CLASS[node.__class__] for node in self.nodes]
+        self.kind_names: list[str] = [node.kind_name for node in self.nodes]
+        self.start_lines: list[int] = []
+        self.start_columns: list[int] = []
+        self.end_lines: list[int] = []
+        self.end_columns: list[int] = []
+        for node in self.nodes:
+            sloc_range = node.sloc_range
+            self.start_lines.append(sloc_range.start.line)
+            self.start_columns.append(sloc_range.start.column)
+            self.end_lines.append(sloc_range.end.line)
+            self.end_columns.append(sloc_range.end.column)
+
+        self.texts: list[Optional[str]] = [None] * len(self.nodes)
+
+    def text(self, node: AdaNode) -> str:
+        i = self.index[node]
+        text = self.texts[i]
+        if text is None:
+            text = self.texts[i] = node.text
+        return text
+
+    def kind(self, node: AdaNode) -> int:
+        return self.kinds[self.index[node]]
+
+    def kind_name(self, node: AdaNode) -> str:
+        return self.kind_names[self.index[node]]
+
+    def start(self, node: AdaNode) -> tuple[int, int]:
+        i = self.index[node]
+        return self.start_lines[i], self.start_columns[i]
+
+    def end(self, node: AdaNode) -> tuple[int, int]:
+        i = self.index[node]
+        return self.end_lines[i], self.end_columns[i]
+
+
+_tables: OrderedDict[AdaNode, AdaNodeTable] = OrderedDict()
+_node_to_table: dict[AdaNode, AdaNodeTable] = {}
+
+
+def snapshot(node: AdaNode) -> AdaNodeTable:
+    """Return the table of the unit containing node, building it on first use."""
+    table = _node_to_table.get(node)
+    if table is not None:
+        _tables.move_to_end(table.root)
+        return table
+
+    root = node.unit.root
+    table = AdaNodeTable(root)
+    _tables[root] = table
+    for n in table.nodes:
+        _node_to_table[n] = table
+
+    if len(_tables) > NODE_TABLE_CACHE_SIZE:
+        _, evicted = _tables.popitem(last=False)
+        for n in evicted.nodes:
+            if _node_to_table.get(n) is evicted:
+                del _node_to_table[n]
+    return table
+
+
+def table_of(node: AdaNode) -> Optional[AdaNodeTable]:
+    return _node_to_table.get(node)
+
+
+def clear():
+    """Drop all the tables, so that the nodes of their units and the analysis contexts can be freed."""
+    _tables.clear()
+    _node_to_table.clear()
+
+
+def node_text(node: AdaNode) -> str:
+    table = _node_to_table.get(node)
+    return table.text(node) if table is not None else node.text
+
+
+def node_parent(node: AdaNode) -> Optional[AdaNode]:
+    table = _node_to_table.get(node)
+    if table is None:
+        return node.parent
+    parent = table.parents[table.index[node]]
+    return table.nodes[parent] if parent >= 0 else None
+
+
+def node_children(node: AdaNode) -> list[AdaNode]:
+    table = _node_to_table.get(node)
+    if table is None:
+        return [child for child in node.children if child is not None]
+    return table.children(node)
+
+
+def node_start(node: AdaNode) -> tuple[int, int]:
+    table = _node_to_table.get(node)
+    if table is None:
+        return node.sloc_range.start.line, node.sloc_range.start.column
+    return table.start(node)
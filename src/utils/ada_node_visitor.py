@@ -1,15 +1,45 @@
 from __future__ import annotations
 
+from collections import OrderedDict
+from typing import Iterable
+
 from libadalang import AdaNode
 
+from utils.ada_node_table import FlatTree, table_of
+
+
+FLAT_TREE_CACHE_SIZE = 64
+
+
+_flat_trees: OrderedDict[AdaNode, FlatTree] = OrderedDict()
+
+
+def flatten(node: AdaNode) -> FlatTree:
+    """Return the cached pre-order snapshot of the subtree rooted at node, building it on first use."""
+    tree = _flat_trees.get(node)
+    if tree is not None:
+        _flat_trees.move_to_end(node)
+        return tree
+
+    table = table_of(node)
+    tree = table.subtree(node) if table is not None else FlatTree(node)
+    _flat_trees[node] = tree
+    if len(_flat_trees) > FLAT_TREE_CACHE_SIZE:
+        _flat_trees.popitem(last=False)
+    return tree
+
+
+def clear_flat_tree_cache():
+    _flat_trees.clear()
+
 
 def accept(node: AdaNode, visitor: AdaNodeVisitor):
-    visitor.pre_visit(node)
-    if visitor.visit(node):
-        for child in node.children:
-            if child is not None:
-                accept(child, visitor)
-    visitor.post_visit(node)
+    flatten(node).accept([visitor])
+
+
+def accept_all(node: AdaNode, visitors: Iterable[AdaNodeVisitor]):
+    """Run several visitors over the same tree in a single walk."""
+    flatten(node).accept(visitors)
 
 
 class AdaNodeVisitor:
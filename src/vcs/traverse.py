@@ -1,8 +1,6 @@
 import multiprocessing
 import os
 import sys
-import uuid
-import pickle
 import time
 import json
 import subprocess
@@ -11,15 +9,19 @@ import datetime
 import libadalang as lal
 
 from multiprocessing.pool import Pool
-from log import logger
+from typing import NamedTuple
+from log import logger, metrics, attach_log_queue
 from pathlib import Path
 from pydriller import Repository
 from pydriller.domain.commit import ModificationType
 
 import settings
 import changegraph
+from changegraph import storage
 from utils.ada_node_id_mapper import AdaNodeIdMapper
-from utils.ada_node_visitor import accept
+from utils import ada_node_table
+from utils.ada_node_table import snapshot, node_text
+from utils.ada_node_visitor import flatten, clear_flat_tree_cache
 
 
 class GitAnalyzer:
@@ -81,7 +83,8 @@ class GitAnalyzer:
             commits = self._extract_commits(repo_name)
 
             if GitAnalyzer.TRAVERSE_ASYNC:
-                with Pool(processes=multiprocessing.cpu_count()) as pool:
+                with Pool(processes=multiprocessing.cpu_count(),
+                          initializer=attach_log_queue, initargs=(logger.get_queue(),)) as pool:
                     pool.imap_unordered(self._build_and_store_change_graphs, commits)
                     pool.close()
                     pool.join()
@@ -101,7 +104,6 @@ class GitAnalyzer:
         commits_traversed = 0
 
         for commit in repo.traverse_commits():
-            logger.warning(f'commits traversed {commits_traversed}')
             if commits_traversed >= GitAnalyzer.TRAVERSE_MAX_COMMITS:
                 break
             if not commit.parents:
@@ -145,6 +147,9 @@ class GitAnalyzer:
 
             yield cut
             commits_traversed += 1
+            logger.progress('commits traversed', commits_traversed)
+
+        logger.progress_done('commits traversed')
 
     @staticmethod
     def _get_repo_url(repo_path):
@@ -161,16 +166,32 @@ class GitAnalyzer:
         #                                                        graph.repo_info.repo_name,
         #                                                        f'{str(uuid.uuid4())}.dot'))
 
-        filename = uuid.uuid4().hex
-        logger.info(f'Trying to store graph to {filename}', show_pid=True)
-        filename = os.path.join(GitAnalyzer.STORAGE_DIR, graph.repo_info.repo_name, f'{filename}.pickle')
-        os.makedirs(os.path.dirname(filename), exist_ok=True)
-        with open(filename, 'w+b') as f:
-            pickle.dump(graph, f, protocol=5)
+        graph.build_adjacency()
+
+        with metrics.timer('graph_storing'):
+            if graph.repo_info:
+                graph.repo_info.old_method.store_src()
+                graph.repo_info.new_method.store_src()
+
+            logger.info(f'Trying to store graph to {graph.id}', show_pid=True)
+            filename = storage.store_graph(graph)
         logger.info(f'Storing graphs to {filename} finished', show_pid=True)
 
     @staticmethod
     def _build_and_store_change_graphs(commit):
+        repo_name = commit['repo']['name']
+        try:
+            with metrics.timer('commit', repo=repo_name):
+                GitAnalyzer._build_and_store_commit_change_graphs(commit)
+        finally:
+            # the nodes of a commit are not used afterwards, the cached snapshots would keep their contexts alive
+            ada_node_table.clear()
+            clear_flat_tree_cache()
+        metrics.inc('commits', repo=repo_name)
+        metrics.flush()
+
+    @staticmethod
+    def _build_and_store_commit_change_graphs(commit):
         commit_msg = commit['msg'].replace('\n', '; ')
         logger.info(f'Looking at commit #{commit["hash"]}, msg: "{commit_msg}"', show_pid=True)
 
@@ -213,8 +234,10 @@ class GitAnalyzer:
                 )
 
                 try:
-                    cg = changegraph.build_from_trees(old_method.ast, new_method.ast, old_method.src, new_method.src, repo_info=repo_info)
+                    with metrics.timer('change_graph', repo=repo_info.repo_name):
+                        cg = changegraph.build_from_trees(old_method.ast, new_method.ast, old_method.src, new_method.src, repo_info=repo_info)
                 except:
+                    metrics.inc('change_graph_failures', repo=repo_info.repo_name)
                     logger.log(logger.ERROR,
                                f'Unable to build a change graph for '
                                f'repo={commit["repo"]["path"]}, '
@@ -224,6 +247,7 @@ class GitAnalyzer:
                     continue
 
                 GitAnalyzer._store_change_graph(cg)
+                metrics.inc('change_graphs', repo=repo_info.repo_name)
 
     @staticmethod
     def _extract_methods(file_path, src, repo_name):
@@ -238,11 +262,12 @@ class GitAnalyzer:
         unit = context.get_from_buffer(os.path.join(project_path, file_path), src)
         ast = unit.root
 
+        tree = snapshot(ast)
         id_mapper = AdaNodeIdMapper()
-        accept(ast, id_mapper)
+        tree.accept([id_mapper])
 
-        methods: list[lal.SubpBody] = ast.findall(lambda n: isinstance(n, lal.SubpBody))
-        return [Method(file_path, m.f_subp_spec.f_subp_name.text, m, src, id_mapper.node_id[m]) for m in methods if m.f_subp_spec.f_subp_name is not None]
+        methods: list[lal.SubpBody] = [n for n in tree.nodes if isinstance(n, lal.SubpBody)]
+        return [Method(file_path, node_text(m.f_subp_spec.f_subp_name), m, src, id_mapper.node_id[m]) for m in methods if m.f_subp_spec.f_subp_name is not None]
 
     @staticmethod
     def _set_unique_names(methods):
@@ -267,27 +292,98 @@ class GitAnalyzer:
         return old_method_to_new
 
 
+class SlocRange(NamedTuple):
+    """Plain copy of a libadalang sloc range, printed the same way."""
+    start_line: int
+    start_column: int
+    end_line: int
+    end_column: int
+
+    @classmethod
+    def create(cls, sloc_range: lal.SlocRange):
+        return cls(sloc_range.start.line, sloc_range.start.column, sloc_range.end.line, sloc_range.end.column)
+
+    def __str__(self):
+        return f'{self.start_line}:{self.start_column}-{self.end_line}:{self.end_column}'
+
+
 class Method:
+    """
+    A subprogram body of a file version. Pickled methods keep their sloc range, the span of their text in the file
+    and the hash of the file source, the source itself goes to the blob store (see store_src) and is loaded back
+    only when the AST is needed again.
+    """
+    TAB_STOP = 8  # the one of the libadalang analysis contexts the sloc ranges come from
+
     def __init__(self, path, name, ast, src, node_id):
         self.file_path = path
         self.ast = ast
         self.ast_node_id = node_id
-        self.source = ast.text
+        self.source = node_text(ast)
         self.src = src
+        self.src_hash = storage.content_hash(src)
+        self._src_stored = False
+
+        self.sloc_range = SlocRange.create(ast.sloc_range)
+        self.byte_span = self._get_byte_span(src, self.source, self.sloc_range)
 
         self.name = name
         self.full_name = name
 
+    @classmethod
+    def _get_byte_span(cls, src, source, sloc_range):
+        line_start = 0
+        for _ in range(sloc_range.start_line - 1):
+            line_start = src.find('\n', line_start) + 1
+
+        # columns count characters, except that a tab goes on to the next tab stop
+        start = line_start
+        column = 1
+        while column < sloc_range.start_column:
+            if start >= len(src) or src[start] == '\n':
+                return None
+            if src[start] == '\t':
+                column += cls.TAB_STOP - (column - 1) % cls.TAB_STOP
+            else:
+                column += 1
+            start += 1
+
+        if column != sloc_range.start_column or not src.startswith(source, start):
+            return None
+
+        start_byte = len(src[:start].encode('utf-8'))
+        return start_byte, start_byte + len(source.encode('utf-8'))
+
     def extend_path(self, prefix, separator='.'):
         self.full_name = f'{prefix}{separator}{self.full_name}'
 
     def get_source(self):
         return self.source
 
+    def get_sloc_range(self) -> SlocRange:
+        """Sloc range taken when the method was extracted, methods pickled before that parse the unit once."""
+        if getattr(self, 'sloc_range', None) is None:
+            self.sloc_range = SlocRange.create(self.get_ast().sloc_range)
+        return self.sloc_range
+
+    def store_src(self):
+        """Put the file source to the blob store, so pickled methods only keep its hash."""
+        if getattr(self, 'src', None) is not None:
+            storage.store_blob(self.src)
+            self._src_stored = True
+
+    def get_src(self):
+        src = getattr(self, 'src', None)
+        if src is None:
+            src = storage.load_blob(self.src_hash)
+        return src
+
     def __getstate__(self):
         state = self.__dict__.copy()
         if 'ast' in state:
             del state['ast']
+        if state.pop('_src_stored', False):
+            del state['src']
         return state
 
     def __setstate__(self, state):
@@ -297,8 +393,8 @@ class Method:
         if not hasattr(self, 'ast'):
             id_mapper = AdaNodeIdMapper()
             context = lal.AnalysisContext()
-            unit = context.get_from_buffer(self.file_path, self.src)
-            accept(unit.root, id_mapper)
+            unit = context.get_from_buffer(self.file_path, self.get_src())
+            flatten(unit.root).accept([id_mapper])
             self.ast = id_mapper.id_node[self.ast_node_id]
         return self.ast
 